@@ -1,9 +1,17 @@
-from .visualization_agent import VisualizationAgent
-from .density_field_agent import DensityFieldAgent
-from .base_agent import BaseAgent, ExecutorAgent
-from .base_retriever import ParameterRetriever
-from .parameter_retriever import PhysicsPaperRetriever
-from .code_executor import CodeExecutor, SharedCodeExecutor
+import importlib
+
+# Agents are loaded on first attribute access (PEP 562) so that importing the
+# package does not pull in autogen/openai until an agent is actually used
+_LAZY_IMPORTS = {
+    'VisualizationAgent': 'visualization_agent',
+    'DensityFieldAgent': 'density_field_agent',
+    'BaseAgent': 'base_agent',
+    'ExecutorAgent': 'base_agent',
+    'ParameterRetriever': 'base_retriever',
+    'PhysicsPaperRetriever': 'parameter_retriever',
+    'CodeExecutor': 'code_executor',
+    'SharedCodeExecutor': 'code_executor'
+}
 
 __all__ = [
     'VisualizationAgent',
@@ -14,4 +22,17 @@ __all__ = [
     'PhysicsPaperRetriever',
     'CodeExecutor',
     'SharedCodeExecutor'
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        module = importlib.import_module(f".{_LAZY_IMPORTS[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
\ No newline at end of file
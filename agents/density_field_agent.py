@@ -1,11 +1,22 @@
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Iterator, TYPE_CHECKING
 import os
-import tempfile
-from autogen import LLMConfig, ConversableAgent
-from autogen.coding import LocalCommandLineCodeExecutor
-from autogen.agentchat.contrib.gpt_assistant_agent import GPTAssistantAgent
-from agents.base_agent import BaseAgent
-from agents.code_executor import SharedCodeExecutor
+import json
+import asyncio
+import atexit
+import functools
+
+try:
+    # RE2 guarantees linear-time matching on large (batched) responses
+    import re2 as _re
+except ImportError:
+    import re as _re
+
+# openai and autogen are imported where they are used so that importing this
+# module (or the agents package) stays cheap
+if TYPE_CHECKING:
+    from autogen import LLMConfig
+
+from agents.vector_store_cache import hash_file, load_index, update_index
 
 
 GAEPSI2_INSTRUCTIONS = """
@@ -35,27 +46,149 @@ Always provide complete, working Python scripts that can be executed directly.
 """
 
 
+TERMINAL_RUN_STATUSES = frozenset({"completed", "failed", "cancelled", "expired"})
+
+# Maps (demo file, content hash, model) to the vector store / assistant built for
+# it, so a new process can reuse them instead of re-uploading the demo file
+RAG_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "simagents", "gaepsi_rag.json")
+
+# Upper bound on assistant runs in flight at once from run_many (API rate limits)
+MAX_CONCURRENT_RUNS = 8
+
+# Code fences in assistant responses, and tokens that mark an untagged fence as Python
+# (inline flags so the patterns compile the same under re and re2)
+PYTHON_FENCE_PATTERN = _re.compile(r'(?s)```python\s*\n(.*?)\n```')
+ANY_FENCE_PATTERN = _re.compile(r'(?s)```\s*\n(.*?)\n```')
+PYTHON_HINT_PATTERN = _re.compile(r'\b(?:import|def |if __name__|plt\.|np\.)')
+
+# Sentinel on the first line of each script in a batched response
+SNAPSHOT_SENTINEL_PATTERN = _re.compile(r'(?m)^# --- SNAPSHOT (\d+) ---\s*$')
+
+
+# Static part of every density field request. Kept byte-identical across calls
+# (never formatted) and sent before the per-call inputs so the provider-side
+# prompt cache can reuse the shared prefix.
+DENSITY_FIELD_MESSAGE_PREFIX = """
+Using the gaepsi2 demo code as a reference, create a complete Python script that:
+
+1. Loads particle data from the BigFile directory given in INPUTS
+2. Uses the particle type given in INPUTS (1=dark matter, 0=gas, etc.)
+3. Creates a 3D density field visualization using gaepsi2
+4. Saves the output to the output file given in INPUTS
+
+Requirements:
+- Use the gaepsi2 pipeline from the uploaded demo file
+- Adapt the particle loading for BigFile PART_* format
+- Set appropriate visualization parameters for the simulation box
+- Include proper error handling and logging
+- Make the script self-contained and executable
+
+The script should handle the BigFile structure where particle data is stored in subdirectories like:
+- Position/
+- Velocity/  
+- Mass/
+- ID/
+
+Generate complete, working Python code that can be executed directly.
+"""
+
+DENSITY_FIELD_BATCH_INSTRUCTIONS = """
+INPUTS below is a JSON array with one entry per snapshot. Create one separate script
+per entry, each in its own ```python code block whose first line is exactly:
+# --- SNAPSHOT {index} ---
+where {index} is the entry's "index" value.
+"""
+
+
+class _CodeFenceWriter:
+    """Copies the first ```python block of a streamed response to a file as it arrives."""
+    
+    OPEN_FENCE = "```python"
+    CLOSE_FENCE = "\n```"
+    
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ""
+        self.found = False
+        self.done = False
+    
+    def feed(self, text: str) -> None:
+        """Consume the next chunk of response text."""
+        if self.done:
+            return
+        self.buffer += text
+        
+        if not self.found:
+            # Text before the fence is kept whole so it can be used as a fallback
+            start = self.buffer.find(self.OPEN_FENCE)
+            newline = self.buffer.find("\n", start) if start != -1 else -1
+            if newline == -1:
+                return
+            self.buffer = self.buffer[newline + 1:]
+            self.found = True
+        
+        end = self.buffer.find(self.CLOSE_FENCE)
+        if end != -1:
+            self.f.write(self.buffer[:end] + "\n")
+            self.buffer = ""
+            self.done = True
+            return
+        
+        # Hold back just enough to recognise a closing fence split across chunks
+        keep = len(self.CLOSE_FENCE) - 1
+        if len(self.buffer) > keep:
+            self.f.write(self.buffer[:-keep])
+            self.buffer = self.buffer[-keep:]
+    
+    def close(self) -> None:
+        """Flush what is left of an unterminated block."""
+        if self.found and not self.done:
+            self.f.write(self.buffer)
+            self.buffer = ""
+            self.done = True
+
+
 class DensityFieldAgent:
     """Agent for creating density field visualizations using gaepsi2 with RAG."""
     
+    # Shared across instances: OpenAI clients keyed by API key, and the
+    # (vector_store_id, assistant_id) pair keyed by (demo path, mtime, model, API key).
+    # Live instances using each pair are counted in _cache_refcounts; cleanup() by the
+    # last one deletes the vector store. Cached vector stores still left are deleted at
+    # interpreter exit by _cleanup_all, except those persisted to the on-disk RAG cache
+    # (_persistent_keys).
+    _client_cache: Dict[str, Any] = {}
+    _assistant_cache: Dict[tuple, tuple] = {}
+    _cache_refcounts: Dict[tuple, int] = {}
+    _persistent_keys: set = set()
+    
     def __init__(
         self,
         name: str = "density_field_agent",
-        llm_config: Optional[LLMConfig] = None,
+        llm_config: Optional["LLMConfig"] = None,
         gaepsi2_demo_path: str = None,
+        rag_cache_path: Optional[str] = RAG_CACHE_PATH,
         **kwargs
     ):
         """
         Initialize density field agent.
         
+        For one-shot use without the on-disk RAG cache, prefer
+        ``with DensityFieldAgent(..., rag_cache_path=None) as agent:`` so the
+        RAG resources are released as soon as the block exits.
+        
         Args:
             name: Agent name
             llm_config: LLM configuration (if None, uses default settings)
             gaepsi2_demo_path: Path to gaepsi2 demo file (if None, uses default)
+            rag_cache_path: JSON file persisting the vector store / assistant IDs
+                across processes (if None, they are created per process and
+                deleted on cleanup)
             **kwargs: Additional arguments
         """
         self.name = name
         self.gaepsi2_demo_path = gaepsi2_demo_path or self._get_default_demo_path()
+        self.rag_cache_path = rag_cache_path
         
         # Set default LLM config if none provided
         if llm_config is None:
@@ -73,6 +206,11 @@ class DensityFieldAgent:
         self.llm_config = llm_config
         self._vector_store_id = None
         self._assistant_id = None
+        self._cache_key = None
+        
+        # Per-agent memo of assistant responses keyed by the exact message, so the
+        # same request from different entry points costs only one run
+        self._cached_run_assistant = functools.lru_cache(maxsize=128)(self._run_assistant)
         
         # Setup GPT Assistant with RAG
         self._setup_gpt_assistant()
@@ -84,11 +222,75 @@ class DensityFieldAgent:
         project_root = os.path.dirname(current_dir)
         return os.path.join(project_root, "data", "gaepsi2_demo.py")
     
-    def _create_vector_store(self):
-        """Create vector store and upload gaepsi2 demo file."""
+    @classmethod
+    def _client_for(cls, api_key: str):
+        """Get the shared OpenAI client for an API key."""
         from openai import OpenAI
         
-        client = OpenAI(api_key=self.llm_config["api_key"])
+        client = cls._client_cache.get(api_key)
+        if client is None:
+            client = OpenAI(api_key=api_key)
+            cls._client_cache[api_key] = client
+        return client
+    
+    def _get_client(self):
+        """Get the shared OpenAI client for this agent's API key."""
+        return self._client_for(self.llm_config["api_key"])
+    
+    def _assistant_cache_key(self) -> tuple:
+        """Key identifying the demo file version and model an assistant was built for."""
+        mtime = None
+        if os.path.exists(self.gaepsi2_demo_path):
+            mtime = os.path.getmtime(self.gaepsi2_demo_path)
+        return (self.gaepsi2_demo_path, mtime, self.llm_config["model"], self.llm_config["api_key"])
+    
+    def _rag_cache_entry_key(self) -> Optional[str]:
+        """Key for the on-disk RAG cache, based on the demo file's content hash."""
+        if not os.path.exists(self.gaepsi2_demo_path):
+            return None
+        digest = hash_file(self.gaepsi2_demo_path)
+        return f"{os.path.abspath(self.gaepsi2_demo_path)}:{digest}:{self.llm_config['model']}"
+    
+    def _load_persisted_assistant(self, client, entry_key: str) -> Optional[tuple]:
+        """
+        Look up a persisted (vector_store_id, assistant_id) pair and check that
+        both the assistant and its vector store still exist.
+        
+        Args:
+            client: OpenAI client
+            entry_key: Key from _rag_cache_entry_key
+            
+        Returns:
+            (vector_store_id, assistant_id), or None on a miss
+        """
+        try:
+            entry = load_index(self.rag_cache_path).get(entry_key)
+        except OSError as e:
+            print(f"⚠️ Warning: Could not read RAG cache {self.rag_cache_path}: {e}")
+            return None
+        
+        if not isinstance(entry, dict):
+            return None
+        vector_store_id = entry.get("vector_store_id")
+        assistant_id = entry.get("assistant_id")
+        if not vector_store_id or not assistant_id:
+            print(f"⚠️ Warning: Ignoring malformed RAG cache entry for {entry_key}")
+            return None
+        
+        from openai import OpenAIError
+        
+        try:
+            client.beta.assistants.retrieve(assistant_id)
+            client.vector_stores.retrieve(vector_store_id)
+        except OpenAIError as e:
+            print(f"Persisted assistant {assistant_id} / vector store {vector_store_id} not usable: {e}")
+            return None
+        
+        return vector_store_id, assistant_id
+    
+    def _create_vector_store(self):
+        """Create vector store and upload gaepsi2 demo file."""
+        client = self._get_client()
         
         # Create vector store
         vector_store = client.vector_stores.create(
@@ -110,9 +312,28 @@ class DensityFieldAgent:
     
     def _setup_gpt_assistant(self):
         """Setup the GPT Assistant agent with RAG."""
-        from openai import OpenAI
+        # Reuse the vector store and assistant built by an earlier instance
+        key = self._assistant_cache_key()
+        cached = DensityFieldAgent._assistant_cache.get(key)
+        if cached is not None:
+            self._vector_store_id, self._assistant_id = cached
+            self._acquire_cache_entry(key)
+            print(f"✅ Reusing GPT Assistant: {self._assistant_id}")
+            return
+        
+        client = self._get_client()
         
-        client = OpenAI(api_key=self.llm_config["api_key"])
+        # Reuse the vector store and assistant persisted by an earlier process
+        entry_key = self._rag_cache_entry_key() if self.rag_cache_path else None
+        if entry_key:
+            persisted = self._load_persisted_assistant(client, entry_key)
+            if persisted is not None:
+                self._vector_store_id, self._assistant_id = persisted
+                DensityFieldAgent._assistant_cache[key] = persisted
+                DensityFieldAgent._persistent_keys.add(key)
+                self._acquire_cache_entry(key)
+                print(f"✅ Reusing persisted GPT Assistant: {self._assistant_id}")
+                return
         
         # Create vector store and upload demo file
         self._vector_store_id = self._create_vector_store()
@@ -133,14 +354,29 @@ class DensityFieldAgent:
         )
         
         self._assistant_id = assistant.id
+        DensityFieldAgent._assistant_cache[key] = (self._vector_store_id, self._assistant_id)
+        self._acquire_cache_entry(key)
         print(f"✅ Created GPT Assistant: {self._assistant_id}")
+        
+        # Persisted resources outlive this process; otherwise this instance owns them
+        if entry_key:
+            try:
+                update_index(self.rag_cache_path, {entry_key: {
+                    "vector_store_id": self._vector_store_id,
+                    "assistant_id": self._assistant_id
+                }})
+                DensityFieldAgent._persistent_keys.add(key)
+            except OSError as e:
+                print(f"⚠️ Warning: Could not write RAG cache {self.rag_cache_path}: {e}")
+    
+    def _acquire_cache_entry(self, key: tuple) -> None:
+        """Count this instance as a user of a shared assistant cache entry."""
+        self._cache_key = key
+        DensityFieldAgent._cache_refcounts[key] = DensityFieldAgent._cache_refcounts.get(key, 0) + 1
     
     def _run_assistant(self, message: str) -> str:
         """Run the assistant with a message and return response."""
-        from openai import OpenAI
-        import time
-        
-        client = OpenAI(api_key=self.llm_config["api_key"])
+        client = self._get_client()
         
         # Create thread
         thread = client.beta.threads.create()
@@ -152,42 +388,221 @@ class DensityFieldAgent:
             content=message
         )
         
-        # Run assistant
-        run = client.beta.threads.runs.create(
+        # Stream the run so completion arrives as an event instead of being polled
+        with client.beta.threads.runs.stream(
             thread_id=thread.id,
             assistant_id=self._assistant_id
+        ) as stream:
+            stream.until_done()
+            run = stream.current_run
+            final_messages = stream.get_final_messages()
+        
+        # The stream can close before the run settles; fall back to polling
+        if run is not None and run.status not in TERMINAL_RUN_STATUSES:
+            run = self._wait_for_run(client, thread.id, run)
+            final_messages = client.beta.threads.messages.list(thread_id=thread.id).data
+        
+        if run is None or run.status != "completed":
+            status = run.status if run is not None else "unknown"
+            raise Exception(f"Assistant run failed with status: {status}")
+        
+        # Get response
+        for msg in final_messages:
+            if msg.role == "assistant":
+                return msg.content[0].text.value
+        
+        raise ValueError("No assistant response found")
+    
+    async def _run_assistant_async(self, message: str, aclient=None) -> str:
+        """
+        Async variant of _run_assistant so several runs can overlap.
+        
+        Args:
+            message: Message to send to the assistant
+            aclient: AsyncOpenAI client (if None, a temporary one is created)
+            
+        Returns:
+            Assistant response text
+        """
+        from openai import AsyncOpenAI
+        
+        if aclient is None:
+            async with AsyncOpenAI(api_key=self.llm_config["api_key"]) as aclient:
+                return await self._run_assistant_async(message, aclient)
+        
+        thread = await aclient.beta.threads.create(
+            messages=[{"role": "user", "content": message}]
+        )
+        
+        async with aclient.beta.threads.runs.stream(
+            thread_id=thread.id,
+            assistant_id=self._assistant_id
+        ) as stream:
+            await stream.until_done()
+            run = stream.current_run
+            final_messages = await stream.get_final_messages()
+        
+        # The stream can close before the run settles; fall back to polling
+        if run is not None and run.status not in TERMINAL_RUN_STATUSES:
+            run = await asyncio.wait_for(
+                aclient.beta.threads.runs.poll(run.id, thread_id=thread.id, poll_interval_ms=200),
+                timeout=300
+            )
+            final_messages = (await aclient.beta.threads.messages.list(thread_id=thread.id)).data
+        
+        if run is None or run.status != "completed":
+            status = run.status if run is not None else "unknown"
+            raise Exception(f"Assistant run failed with status: {status}")
+        
+        for msg in final_messages:
+            if msg.role == "assistant":
+                return msg.content[0].text.value
+        
+        raise ValueError("No assistant response found")
+    
+    async def run_many(self, messages: List[str]) -> List[str]:
+        """
+        Run several independent assistant requests concurrently.
+        
+        Args:
+            messages: Messages to send to the assistant
+            
+        Returns:
+            Assistant responses, in the same order as messages
+        """
+        from openai import AsyncOpenAI
+        
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_RUNS)
+        
+        async with AsyncOpenAI(api_key=self.llm_config["api_key"]) as aclient:
+            async def run_one(message):
+                async with semaphore:
+                    return await self._run_assistant_async(message, aclient)
+            
+            return await asyncio.gather(*[run_one(message) for message in messages])
+    
+    def _stream_code_to_file(self, message: str, script_path: str) -> None:
+        """
+        Run the assistant and write the generated Python code to script_path as
+        it streams in, rather than buffering the whole response.
+        
+        The code is written to a temporary file next to script_path and moved into
+        place with os.replace once the run completes, so script_path is never
+        left half-written. On failure the partial file is kept for inspection.
+        
+        Args:
+            message: Message to send to the assistant
+            script_path: Destination of the generated script
+        """
+        import tempfile
+        
+        client = self._get_client()
+        thread = client.beta.threads.create(
+            messages=[{"role": "user", "content": message}]
         )
         
-        # Wait for completion
-        max_wait = 300  # 5 minutes
+        tmp = tempfile.NamedTemporaryFile(
+            mode='w',
+            dir=os.path.dirname(os.path.abspath(script_path)),
+            prefix=".density_field_",
+            suffix=".py.part",
+            delete=False
+        )
+        try:
+            with tmp:
+                writer = _CodeFenceWriter(tmp)
+                with client.beta.threads.runs.stream(
+                    thread_id=thread.id,
+                    assistant_id=self._assistant_id
+                ) as stream:
+                    for event in stream:
+                        if event.event != "thread.message.delta":
+                            continue
+                        for block in event.data.delta.content or []:
+                            if block.type == "text" and block.text and block.text.value:
+                                writer.feed(block.text.value)
+                    run = stream.current_run
+                
+                if run is not None and run.status not in TERMINAL_RUN_STATUSES:
+                    run = self._wait_for_run(client, thread.id, run)
+                if run is None or run.status != "completed":
+                    status = run.status if run is not None else "unknown"
+                    raise Exception(f"Assistant run failed with status: {status}")
+                
+                # No ```python fence was seen: fall back to regular extraction
+                if not writer.found:
+                    response = writer.buffer
+                    tmp.write(self._extract_python_code(response) or response)
+                else:
+                    writer.close()
+        except Exception:
+            print(f"⚠️ Partial script left at: {tmp.name}")
+            raise
+        
+        os.replace(tmp.name, script_path)
+    
+    def _wait_for_run(self, client, thread_id: str, run, max_wait: float = 300):
+        """
+        Poll a run with exponential backoff until it reaches a terminal status.
+        
+        Args:
+            client: OpenAI client
+            thread_id: Thread the run belongs to
+            run: Run object to wait on
+            max_wait: Timeout in seconds before the run is cancelled
+            
+        Returns:
+            The run in its terminal state
+        """
+        import time
+        
         start_time = time.time()
+        attempt = 0
         
-        while run.status not in ["completed", "failed", "cancelled"]:
+        while run.status not in TERMINAL_RUN_STATUSES:
             if time.time() - start_time > max_wait:
-                client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
+                client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
                 raise TimeoutError("Assistant run timed out")
             
-            time.sleep(2)
+            # 200 ms growing by 1.5x per attempt, capped at 2 s
+            time.sleep(min(2.0, 0.2 * 1.5 ** attempt))
+            attempt += 1
             run = client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
+                thread_id=thread_id,
                 run_id=run.id
             )
         
-        if run.status != "completed":
-            raise Exception(f"Assistant run failed with status: {run.status}")
-        
-        # Get response
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data:
-            if msg.role == "assistant":
-                return msg.content[0].text.value
-        
-        raise ValueError("No assistant response found")
+        return run
     
     def setup(self) -> None:
         """Setup method (already done in __init__)."""
         pass
     
+    def _build_density_field_message(
+        self,
+        part_dir: str,
+        output_file: str,
+        particle_type: int = 1
+    ) -> str:
+        """
+        Build a density field request with the static prefix first and the
+        per-call inputs appended last.
+        
+        Args:
+            part_dir: Path to PART_* directory containing particle data
+            output_file: Output image filename
+            particle_type: Particle type to visualize
+            
+        Returns:
+            Message string
+        """
+        return DENSITY_FIELD_MESSAGE_PREFIX + f"""
+INPUTS:
+part_dir={part_dir}
+output_file={output_file}
+particle_type={particle_type}
+"""
+    
     def generate_density_field_code(
         self,
         part_dir: str,
@@ -205,31 +620,9 @@ class DensityFieldAgent:
         Returns:
             Generated Python code as string
         """
-        message = f"""
-Using the gaepsi2 demo code as a reference, create a complete Python script that:
-
-1. Loads particle data from BigFile directory: {part_dir}
-2. Uses particle type {particle_type} (1=dark matter, 0=gas, etc.)
-3. Creates a 3D density field visualization using gaepsi2
-4. Saves the output as: {output_file}
-
-Requirements:
-- Use the gaepsi2 pipeline from the uploaded demo file
-- Adapt the particle loading for BigFile PART_* format
-- Set appropriate visualization parameters for the simulation box
-- Include proper error handling and logging
-- Make the script self-contained and executable
-
-The script should handle the BigFile structure where particle data is stored in subdirectories like:
-- Position/
-- Velocity/  
-- Mass/
-- ID/
-
-Generate complete, working Python code that can be executed directly.
-"""
+        message = self._build_density_field_message(part_dir, output_file, particle_type)
         
-        return self._run_assistant(message)
+        return self._cached_run_assistant(message)
     
     def create_density_field_visualization(
         self,
@@ -260,14 +653,11 @@ Generate complete, working Python code that can be executed directly.
         # Generate output filename
         output_file = os.path.join(output_dir, f"density_field_{snapshot_name}_type{particle_type}.png")
         
-        # Generate the code
+        # Generate the code, streaming it straight into the script file
         print(f"🎨 Generating density field code for {part_dir}")
-        code = self.generate_density_field_code(part_dir, output_file, particle_type)
-        
-        # Save the generated script
+        message = self._build_density_field_message(part_dir, output_file, particle_type)
         script_path = os.path.join(output_dir, f"density_field_script_{snapshot_name}.py")
-        with open(script_path, 'w') as f:
-            f.write(code)
+        self._stream_code_to_file(message, script_path)
         
         print(f"✅ Generated script: {script_path}")
         print(f"📊 Output will be saved to: {output_file}")
@@ -304,33 +694,13 @@ Generate complete, working Python code that can be executed directly.
         output_file = os.path.join(output_dir, f"density_field_{snapshot_name}_type{particle_type}.png")
         
         # Create message for code generation
-        message = f"""
-Using the gaepsi2 demo code as a reference, create and execute a complete Python script that:
-
-1. Loads particle data from BigFile directory: {part_dir}
-2. Uses particle type {particle_type} (1=dark matter, 0=gas, etc.)
-3. Creates a 3D density field visualization using gaepsi2
-4. Saves the output as: {output_file}
-
-Requirements:
-- Use the gaepsi2 pipeline from the uploaded demo file
-- Adapt the particle loading for BigFile PART_* format
-- Set appropriate visualization parameters for the simulation box
-- Include proper error handling and logging
-- Make the script self-contained and executable
-
-The script should handle the BigFile structure where particle data is stored in subdirectories like:
-- Position/
-- Velocity/  
-- Mass/
-- ID/
-
-Generate complete, working Python code that can be executed directly.
-"""
+        message = self._build_density_field_message(part_dir, output_file, particle_type)
         
         print(f"🎯 Generating and executing density field code for {part_dir}")
         
         # Get shared code executor
+        from agents.code_executor import SharedCodeExecutor
+        
         code_executor = SharedCodeExecutor.get_executor()
         
         # Execute through the assistant
@@ -341,6 +711,120 @@ Generate complete, working Python code that can be executed directly.
         
         return result
     
+    async def generate_and_execute_density_field_async(
+        self,
+        simulation_output_dir: str,
+        output_dir: str,
+        snapshot_name: str = "PART_000",
+        particle_type: int = 1
+    ) -> Any:
+        """
+        Async variant of generate_and_execute_density_field, for running several
+        snapshots or particle types concurrently with asyncio.gather.
+        
+        Args:
+            simulation_output_dir: Directory containing PART_* snapshots
+            output_dir: Directory to save visualization output
+            snapshot_name: Name of snapshot directory (e.g., "PART_000")
+            particle_type: Particle type to visualize
+            
+        Returns:
+            Execution result from the code executor
+        """
+        part_dir = os.path.join(simulation_output_dir, snapshot_name, str(particle_type))
+        if not os.path.exists(part_dir):
+            raise FileNotFoundError(f"PART directory not found: {part_dir}")
+        
+        output_file = os.path.join(output_dir, f"density_field_{snapshot_name}_type{particle_type}.png")
+        message = self._build_density_field_message(part_dir, output_file, particle_type)
+        
+        print(f"🎯 Generating and executing density field code for {part_dir}")
+        from agents.code_executor import SharedCodeExecutor
+        
+        code_executor = SharedCodeExecutor.get_executor()
+        
+        try:
+            assistant_response = await self._run_assistant_async(message)
+            # Code execution blocks on a subprocess; keep it off the event loop
+            return await asyncio.to_thread(
+                self._execute_assistant_response, assistant_response, code_executor
+            )
+        except Exception as e:
+            print(f"💥 Error during execution: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def generate_and_execute_density_field_batch(
+        self,
+        simulation_output_dir: str,
+        output_dir: str,
+        snapshot_names: List[str],
+        particle_type: int = 1,
+        max_workers: int = 4
+    ) -> List[Any]:
+        """
+        Generate density field code for several snapshots in one assistant run and
+        execute the resulting scripts concurrently.
+        
+        Args:
+            simulation_output_dir: Directory containing PART_* snapshots
+            output_dir: Directory to save visualization output
+            snapshot_names: Names of snapshot directories (e.g., ["PART_000", "PART_001"])
+            particle_type: Particle type to visualize
+            max_workers: Maximum number of scripts executed at once
+            
+        Returns:
+            List of execution results, in the same order as snapshot_names
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        
+        specs = []
+        for index, snapshot_name in enumerate(snapshot_names):
+            part_dir = os.path.join(simulation_output_dir, snapshot_name, str(particle_type))
+            if not os.path.exists(part_dir):
+                raise FileNotFoundError(f"PART directory not found: {part_dir}")
+            specs.append({
+                "index": index,
+                "part_dir": part_dir,
+                "output_file": os.path.join(output_dir, f"density_field_{snapshot_name}_type{particle_type}.png"),
+                "particle_type": particle_type
+            })
+        
+        message = (
+            DENSITY_FIELD_MESSAGE_PREFIX
+            + DENSITY_FIELD_BATCH_INSTRUCTIONS
+            + f"\nINPUTS:\n{json.dumps(specs, indent=2)}\n"
+        )
+        
+        print(f"🎯 Generating density field code for {len(specs)} snapshots")
+        response = self._run_assistant(message)
+        
+        # Map each tagged ```python block back to its snapshot
+        codes = {}
+        for code in self._iter_python_code(response):
+            sentinel = SNAPSHOT_SENTINEL_PATTERN.search(code)
+            if sentinel:
+                codes.setdefault(int(sentinel.group(1)), code)
+        
+        from agents.code_executor import SharedCodeExecutor
+        
+        code_executor = SharedCodeExecutor.get_executor()
+        
+        def execute(spec):
+            code = codes.get(spec["index"])
+            if code is None:
+                print(f"⚠️ No Python code found for {spec['part_dir']}")
+                return {"success": False, "output": "No code generated", "response": response}
+            return code_executor.execute_code(code)
+        
+        print(f"💾 Executing {len(codes)} generated scripts...")
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(specs)))) as executor:
+            results = list(executor.map(execute, specs))
+        
+        succeeded = sum(1 for result in results if result.get("success", False))
+        print(f"✅ Batch density field visualization completed: {succeeded}/{len(specs)} succeeded")
+        
+        return results
+    
     def _run_assistant_with_execution(self, message: str, code_executor) -> Any:
         """
         Run the assistant with a message and execute generated code.
@@ -354,31 +838,43 @@ Generate complete, working Python code that can be executed directly.
         """
         try:
             # Get code from assistant
-            assistant_response = self._run_assistant(message)
-            
-            # Extract Python code from response
-            code = self._extract_python_code(assistant_response)
-            
-            if code:
-                print("💾 Executing generated code...")
-                result = code_executor.execute_code(code)
-                
-                # Check if execution was successful
-                if result.get("success", False):
-                    print("✅ Code executed successfully")
-                else:
-                    print("⚠️ Code execution had issues")
-                    print(f"Output: {result.get('output', 'No output')}")
-                
-                return result
-            else:
-                print("⚠️ No Python code found in assistant response")
-                return {"success": False, "output": "No code generated", "response": assistant_response}
+            assistant_response = self._cached_run_assistant(message)
+            return self._execute_assistant_response(assistant_response, code_executor)
                 
         except Exception as e:
             print(f"💥 Error during execution: {e}")
             return {"success": False, "error": str(e)}
     
+    def _execute_assistant_response(self, assistant_response: str, code_executor) -> Any:
+        """
+        Extract the Python code from an assistant response and execute it.
+        
+        Args:
+            assistant_response: Assistant response text
+            code_executor: Code executor instance
+            
+        Returns:
+            Execution result
+        """
+        # Extract Python code from response
+        code = self._extract_python_code(assistant_response)
+        
+        if code:
+            print("💾 Executing generated code...")
+            result = code_executor.execute_code(code)
+            
+            # Check if execution was successful
+            if result.get("success", False):
+                print("✅ Code executed successfully")
+            else:
+                print("⚠️ Code execution had issues")
+                print(f"Output: {result.get('output', 'No output')}")
+            
+            return result
+        else:
+            print("⚠️ No Python code found in assistant response")
+            return {"success": False, "output": "No code generated", "response": assistant_response}
+    
     def _extract_python_code(self, response: str) -> Optional[str]:
         """
         Extract Python code from assistant response.
@@ -389,26 +885,28 @@ Generate complete, working Python code that can be executed directly.
         Returns:
             Extracted Python code or None if not found
         """
-        import re
-        
-        # Look for code blocks marked with ```python
-        pattern = r'```python\s*\n(.*?)\n```'
-        matches = re.findall(pattern, response, re.DOTALL)
-        
-        if matches:
-            return matches[0].strip()
+        return next(self._iter_python_code(response), None)
+    
+    def _iter_python_code(self, response: str) -> Iterator[str]:
+        """
+        Yield the Python code blocks of an assistant response in priority order.
         
-        # Look for code blocks marked with just ```
-        pattern = r'```\s*\n(.*?)\n```'
-        matches = re.findall(pattern, response, re.DOTALL)
+        Blocks marked with ```python come first, followed by plain ``` blocks
+        that look like Python code. Blocks are extracted lazily, so a caller can
+        start on the first one before the rest of the response is scanned.
         
-        if matches:
-            # Check if it looks like Python code
-            code = matches[0].strip()
-            if any(keyword in code for keyword in ['import', 'def ', 'if __name__', 'plt.', 'np.']):
-                return code
+        Args:
+            response: Assistant response text
+            
+        Yields:
+            Extracted Python code blocks
+        """
+        for match in PYTHON_FENCE_PATTERN.finditer(response):
+            yield match.group(1).strip()
         
-        return None
+        for match in ANY_FENCE_PATTERN.finditer(response):
+            if PYTHON_HINT_PATTERN.search(match.group(1)):
+                yield match.group(1).strip()
     
     def create_density_field_message(
         self,
@@ -429,37 +927,64 @@ Generate complete, working Python code that can be executed directly.
         Returns:
             Message string
         """
+        # Static instructions first, per-call paths last (see DENSITY_FIELD_MESSAGE_PREFIX)
         if sr_snapshot_path and side_by_side:
-            message = f"""
-Create Python code using gaepsi2 and BigFile to visualize density fields from:
-- LR snapshot: {lr_snapshot_path}
-- SR snapshot: {sr_snapshot_path}
+            message = """
+Create Python code using gaepsi2 and BigFile to visualize density fields from the
+LR and SR snapshots given in INPUTS.
 
-Create side-by-side comparison plots and save as {output_filename}.
+Create side-by-side comparison plots and save them to the output file given in INPUTS.
 Use the gaepsi2 demo as reference for the visualization pipeline.
+""" + f"""
+INPUTS:
+lr_snapshot={lr_snapshot_path}
+sr_snapshot={sr_snapshot_path}
+output_file={output_filename}
 """
         else:
-            message = f"""
-Create Python code using gaepsi2 and BigFile to visualize density field from:
-- Snapshot: {lr_snapshot_path}
+            message = """
+Create Python code using gaepsi2 and BigFile to visualize the density field from the
+snapshot given in INPUTS.
 
-Save the visualization as {output_filename}.
+Save the visualization to the output file given in INPUTS.
 Use the gaepsi2 demo as reference for the visualization pipeline.
+""" + f"""
+INPUTS:
+snapshot={lr_snapshot_path}
+output_file={output_filename}
 """
         
         return self._run_assistant(message)
     
     def cleanup(self):
-        """Clean up resources."""
-        from openai import OpenAI
+        """
+        Release this instance's use of the shared RAG resources.
+        
+        The vector store is deleted only when the last live instance using it is
+        cleaned up, and never when it is persisted in the on-disk RAG cache.
+        """
+        self._cached_run_assistant.cache_clear()
+        
+        key = self._cache_key
+        if key is None:
+            return
+        self._cache_key = None
+        
+        remaining = DensityFieldAgent._cache_refcounts.get(key, 1) - 1
+        if remaining > 0:
+            DensityFieldAgent._cache_refcounts[key] = remaining
+            return
+        DensityFieldAgent._cache_refcounts.pop(key, None)
+        if key in DensityFieldAgent._persistent_keys:
+            return
         
         try:
-            client = OpenAI(api_key=self.llm_config["api_key"])
-            
-            # Delete vector store
-            if self._vector_store_id:
-                client.vector_stores.delete(vector_store_id=self._vector_store_id)
-                print(f"✅ Cleaned up vector store: {self._vector_store_id}")
+            # Drop the pair from the shared cache and delete its vector store
+            entry = DensityFieldAgent._assistant_cache.pop(key, None)
+            if entry is not None:
+                vector_store_id = entry[0]
+                self._get_client().vector_stores.delete(vector_store_id=vector_store_id)
+                print(f"✅ Cleaned up vector store: {vector_store_id}")
                 
             # Note: Assistant cleanup is optional as they can be reused
             
@@ -477,14 +1002,33 @@ Use the gaepsi2 demo as reference for the visualization pipeline.
             Execution result
         """
         # Get shared code executor
+        from agents.code_executor import SharedCodeExecutor
+        
         code_executor = SharedCodeExecutor.get_executor()
         
         # Execute through the assistant with code execution
         return self._run_assistant_with_execution(message, code_executor)
     
-    def __del__(self):
-        """Destructor to ensure cleanup."""
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
+
+
+def _cleanup_all():
+    """Delete the non-persisted vector stores still held in the shared assistant cache."""
+    for key, (vector_store_id, _) in list(DensityFieldAgent._assistant_cache.items()):
+        if key in DensityFieldAgent._persistent_keys:
+            continue
+        api_key = key[-1]
         try:
-            self.cleanup()
-        except:
-            pass
\ No newline at end of file
+            DensityFieldAgent._client_for(api_key).vector_stores.delete(vector_store_id=vector_store_id)
+        except Exception as e:
+            print(f"⚠️ Warning: Cleanup failed for vector store {vector_store_id}: {e}")
+    DensityFieldAgent._assistant_cache.clear()
+    DensityFieldAgent._cache_refcounts.clear()
+
+
+atexit.register(_cleanup_all)
\ No newline at end of file
@@ -1,10 +1,115 @@
-from openai import OpenAI
+from openai import OpenAI, OpenAIError
+import copy
+import hashlib
+import io
 import json
+import re
 import yaml
-from typing import Dict, Any, Tuple, Optional, List
+from typing import Dict, Any, Tuple, Optional, List, TextIO
 from .base_retriever import ParameterRetriever
+from .vector_store_cache import VS_INDEX_PATH, hash_file, hash_files, load_index, update_index
 import time
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+
+# Documentation files are uploaded in batches of this size, several batches at once
+UPLOAD_BATCH_SIZE = 32
+UPLOAD_MAX_WORKERS = 8
+
+# Documentation file types uploaded to the formatter's vector store
+DOC_FILE_SUFFIXES = frozenset({"pdf", "json"})
+
+TERMINAL_RUN_STATUSES = frozenset({"completed", "failed", "cancelled", "expired"})
+
+# JSON embedded in assistant responses is looked for in a fenced code block first
+JSON_BLOCK_PATTERN = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+
+# Prompts sent during retrieve_parameters; only the {placeholders} change per call
+PHYSICS_QUERY = """Please use file search to extract MP-Gadget simulation parameters from the uploaded paper. 
+Search for specific values and cite where you found them in the paper."""
+
+FORMATTER_TEMPLATE = """Please format these extracted parameters for MP-Gadget.
+Use file search to check the MP-Gadget documentation for proper parameter names, formats, and requirements.
+
+Extracted parameters:
+{physics_response}"""
+
+CLARIFICATION_TEMPLATE = """Based on the paper content, please provide the missing parameters:
+{missing}
+
+Search the paper again for these specific parameters or values that can be used to calculate them.
+Original extracted parameters:
+{physics_response}"""
+
+FINAL_FORMATTER_TEMPLATE = """Please create the final MP-Gadget parameter configuration using all available information.
+Verify against documentation that all required parameters are included.
+
+These parameters were missing:
+{missing}
+
+Use file search on the MP-Gadget documentation where needed to find their descriptions,
+how they can be calculated or derived, default values if applicable, and whether they
+are truly required or optional.
+
+Original parameters:
+{formatter_response}
+
+Additional clarification:
+{physics_clarification}
+
+Ensure the format matches MP-Gadget documentation requirements."""
+
+
+@lru_cache(maxsize=16)
+def _read_prompt_yaml(yaml_path: str, mtime: float) -> Optional[str]:
+    """Parse a prompt YAML file; mtime is part of the cache key so edits are picked up."""
+    with open(yaml_path, 'r', encoding='utf-8') as f:
+        prompt_data = yaml.safe_load(f)
+    return prompt_data.get('system_prompt')
+
+
+def _find_balanced_json(text: str, start: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    Find the first balanced {...} span at or after start in a single pass.
+    
+    Braces inside JSON string literals (including escaped quotes) are ignored.
+    
+    Args:
+        text: Text to scan
+        start: Index to start scanning from
+        
+    Returns:
+        (begin, end) slice bounds of the span, or None if there is none
+    """
+    begin = text.find('{', start)
+    if begin == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(begin, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return begin, i + 1
+    
+    return None
 
 
 class PhysicsPaperRetriever(ParameterRetriever):
@@ -12,15 +117,40 @@ class PhysicsPaperRetriever(ParameterRetriever):
     Retrieves parameters using two specialized OpenAI Assistants with RAG capabilities:
     1. Physics Expert Agent - Extracts parameters from cosmology papers using file search
     2. MP-Gadget Formatter Agent - Formats and validates parameters using MP-Gadget documentation
+    
+    Call cleanup() when done, or use the retriever as a context manager:
+    
+        with PhysicsPaperRetriever(...) as retriever:
+            parameters, reasoning = retriever.retrieve_parameters(paper_content)
     """
     
     def __init__(self, physics_expert_id: str = None, formatter_id: str = None, 
                  mp_gadget_docs_path: str = None, api_key: str = None,
                  physics_prompt_path: str = None, formatter_prompt_path: str = None,
-                 paper_path: str = None, max_iterations: int = 2):
+                 paper_path: str = None, max_iterations: int = 2,
+                 vs_index_path: Optional[str] = VS_INDEX_PATH,
+                 delete_paper_vector_store: bool = True,
+                 pdf_bytes: Optional[Any] = None):
         super().__init__(model_name="Dual RAG OpenAI Assistants", api_key=api_key)
         self.client = OpenAI(api_key=api_key)
         
+        # On-disk index of vector stores by content hash (None disables reuse).
+        # Stores found in or recorded to the index are kept alive for later runs.
+        self.vs_index_path = vs_index_path
+        self._persistent_vector_store_ids = set()
+        
+        # Whether retrieve_parameters removes the per-paper vector store when done
+        self.delete_paper_vector_store = delete_paper_vector_store
+        
+        # Completed results keyed by (paper hash, custom_prompt, max_iterations)
+        self._result_cache = {}
+        
+        # Background paper vector store deletions, joined by cleanup()
+        self._pending_deletions = []
+        
+        # Whether the last retrieve_parameters call produced a complete result
+        self.last_result_complete = False
+        
         # Store document paths
         self.mp_gadget_docs_path = mp_gadget_docs_path
         self.physics_prompt_path = physics_prompt_path
@@ -28,6 +158,10 @@ class PhysicsPaperRetriever(ParameterRetriever):
         self.paper_path = paper_path
         self.max_iterations = max_iterations
         
+        # Contents of paper_path already in memory (bytes or a read-only mmap); when
+        # given, the PDF is hashed and uploaded from it instead of being reopened
+        self.pdf_bytes = pdf_bytes
+        
         # Create or get vector stores for both assistants
         self.physics_vector_store_id = None
         self.formatter_vector_store_id = self._create_formatter_vector_store()
@@ -41,52 +175,114 @@ class PhysicsPaperRetriever(ParameterRetriever):
         self.physics_expert_id = self._get_or_create_physics_expert(physics_expert_id)
         self.formatter_id = self._get_or_create_formatter_agent(formatter_id)
         
-    def _create_formatter_vector_store(self) -> str:
-        """Create vector store for MP-Gadget documentation."""
-        # Create a vector store for MP-Gadget documentation
-        vector_store = self.client.vector_stores.create(
-            name="MP-Gadget Documentation"
-        )
+    def _lookup_vector_store(self, index_key: str) -> Optional[str]:
+        """Return an indexed vector store ID if it still exists remotely."""
+        if not self.vs_index_path:
+            return None
         
-        # Upload MP-Gadget documentation if path provided
+        try:
+            entry = load_index(self.vs_index_path).get(index_key)
+        except OSError as e:
+            print(f"Warning: Could not read vector store index {self.vs_index_path}: {e}")
+            return None
+        if not entry:
+            return None
+        
+        vector_store_id = entry["vector_store_id"]
+        try:
+            self.client.vector_stores.retrieve(vector_store_id)
+        except OpenAIError as e:
+            print(f"Indexed vector store {vector_store_id} not usable: {e}")
+            return None
+        
+        self._persistent_vector_store_ids.add(vector_store_id)
+        return vector_store_id
+    
+    def _record_vector_store(self, index_key: str, vector_store_id: str) -> None:
+        """Record a new vector store in the on-disk index so later runs reuse it."""
+        if not self.vs_index_path:
+            return
+        
+        try:
+            update_index(self.vs_index_path, {index_key: {"vector_store_id": vector_store_id}})
+        except OSError as e:
+            print(f"Warning: Could not write vector store index {self.vs_index_path}: {e}")
+            return
+        
+        self._persistent_vector_store_ids.add(vector_store_id)
+    
+    def _delete_vector_store(self, vector_store_id: str) -> None:
+        """Delete a vector store unless it is kept in the on-disk index."""
+        if vector_store_id in self._persistent_vector_store_ids:
+            return
+        self.client.vector_stores.delete(vector_store_id=vector_store_id)
+    
+    def _create_formatter_vector_store(self) -> Optional[str]:
+        """Create vector store for MP-Gadget documentation (None if there are no docs)."""
+        file_paths = []
         if self.mp_gadget_docs_path:
-            file_paths = []
             if os.path.isfile(self.mp_gadget_docs_path):
                 file_paths = [self.mp_gadget_docs_path]
             elif os.path.isdir(self.mp_gadget_docs_path):
-                # Get all PDF and JSON files from directory
-                for file in os.listdir(self.mp_gadget_docs_path):
-                    if file.endswith(('.pdf', '.json')):
-                        file_paths.append(os.path.join(self.mp_gadget_docs_path, file))
-            
-            # Upload files to vector store
-            file_streams = []
-            try:
-                for path in file_paths:
-                    file_streams.append(open(path, "rb"))
-                
-                if file_streams:
-                    file_batch = self.client.vector_stores.file_batches.upload_and_poll(
-                        vector_store_id=vector_store.id,
-                        files=file_streams
-                    )
-                    
-            finally:
-                # Always close file streams
-                for stream in file_streams:
-                    if not stream.closed:
-                        stream.close()
+                # Get all PDF and JSON files from directory in one pass over its entries
+                with os.scandir(self.mp_gadget_docs_path) as entries:
+                    file_paths = [entry.path for entry in entries
+                                  if entry.name.rpartition('.')[2].lower() in DOC_FILE_SUFFIXES
+                                  and entry.is_file()]
+        
+        # Without documentation there is nothing to search, so skip the empty store
+        if not file_paths:
+            return None
+        
+        # Reuse the store built from identical documentation in an earlier run; the
+        # per-file digests are memoized by size and mtime, so unchanged docs are not re-read
+        index_key = f"docs:{hash_files(file_paths, self.vs_index_path)}"
+        vector_store_id = self._lookup_vector_store(index_key)
+        if vector_store_id:
+            print(f"Using indexed MP-Gadget documentation vector store: {vector_store_id}")
+            return vector_store_id
+        
+        # Create a vector store for MP-Gadget documentation
+        vector_store = self.client.vector_stores.create(
+            name="MP-Gadget Documentation"
+        )
         
+        # Upload batches concurrently; each batch only holds its own files open
+        batches = [file_paths[i:i + UPLOAD_BATCH_SIZE]
+                   for i in range(0, len(file_paths), UPLOAD_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_MAX_WORKERS, len(batches))) as executor:
+            futures = [executor.submit(self._upload_file_batch, vector_store.id, batch)
+                       for batch in batches]
+            for future in as_completed(futures):
+                future.result()
+        
+        self._record_vector_store(index_key, vector_store.id)
         return vector_store.id
     
+    def _upload_file_batch(self, vector_store_id: str, file_paths: List[str]) -> None:
+        """Upload one batch of files to a vector store and wait for indexing."""
+        file_streams = []
+        try:
+            for path in file_paths:
+                file_streams.append(open(path, "rb"))
+            
+            self.client.vector_stores.file_batches.upload_and_poll(
+                vector_store_id=vector_store_id,
+                files=file_streams
+            )
+        finally:
+            # Always close file streams
+            for stream in file_streams:
+                if not stream.closed:
+                    stream.close()
+    
     def _load_prompt_from_yaml(self, yaml_path: str, default_prompt: str) -> str:
         """Load system prompt from YAML file, fallback to default if file not found."""
         if yaml_path and os.path.exists(yaml_path):
             try:
-                with open(yaml_path, 'r', encoding='utf-8') as f:
-                    prompt_data = yaml.safe_load(f)
-                    return prompt_data.get('system_prompt', default_prompt)
-            except Exception as e:
+                prompt = _read_prompt_yaml(yaml_path, os.path.getmtime(yaml_path))
+                return prompt if prompt is not None else default_prompt
+            except (OSError, yaml.YAMLError, AttributeError) as e:
                 print(f"Warning: Could not load prompt from {yaml_path}: {e}")
                 return default_prompt
         return default_prompt
@@ -98,7 +294,7 @@ class PhysicsPaperRetriever(ParameterRetriever):
         try:
             self.client.beta.assistants.retrieve(assistant_id)
             return True
-        except Exception as e:
+        except OpenAIError as e:
             print(f"Assistant {assistant_id} not found: {e}")
             return False
     
@@ -198,67 +394,104 @@ Only output the JSON, no additional text."""
 
         instructions = self._load_prompt_from_yaml(self.formatter_prompt_path, default_prompt)
         
+        # Only attach the documentation store when one was created
+        assistant_params = {}
+        if self.formatter_vector_store_id:
+            assistant_params["tool_resources"] = {
+                "file_search": {
+                    "vector_store_ids": [self.formatter_vector_store_id]
+                }
+            }
+        
         assistant = self.client.beta.assistants.create(
             name="MP-Gadget Formatter with Documentation",
             instructions=instructions,
             model="gpt-4o",
             tools=[{"type": "file_search"}],
-            tool_resources={
-                "file_search": {
-                    "vector_store_ids": [self.formatter_vector_store_id]
-                }
-            },
             temperature=0.01,
-            top_p=0.01
+            top_p=0.01,
+            **assistant_params
         )
         return assistant.id
     
-    def _create_paper_vector_store(self, paper_content: str) -> str:
+    def _hash_paper(self, content: Optional[str] = None, path: Optional[str] = None) -> str:
+        """SHA-256 of the paper, streamed from path if given, else of the text content."""
+        if path and path == self.paper_path and self.pdf_bytes is not None:
+            return hashlib.sha256(self.pdf_bytes).hexdigest()
+        if path:
+            return hash_file(path)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    
+    def _create_paper_vector_store(self, paper_content: str, paper_hash: Optional[str] = None) -> str:
         """Create a vector store for the physics paper."""
-        # Create vector store
-        vector_store = self.client.vector_stores.create(
-            name="Physics Paper"
-        )
+        if paper_hash is None:
+            paper_hash = self._hash_paper(content=paper_content)
         
-        # Create a temporary file with paper content
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-            f.write(paper_content)
-            temp_path = f.name
+        # Reuse the store built from the same text in an earlier run, so its
+        # chunks are not embedded again
+        index_key = f"paper-text:{paper_hash}"
+        vector_store_id = self._lookup_vector_store(index_key)
+        if vector_store_id:
+            return vector_store_id
         
-        # Upload to vector store
-        with open(temp_path, 'rb') as f:
-            file_batch = self.client.vector_stores.file_batches.upload_and_poll(
-                vector_store_id=vector_store.id,
-                files=[f]
-            )
+        # Create vector store, named by content hash so it can be traced to its paper
+        vector_store = self.client.vector_stores.create(
+            name=f"paper-{paper_hash[:12]}"
+        )
         
-        # Clean up temp file
-        os.unlink(temp_path)
+        # Upload the paper straight from memory as a single file; the vector store
+        # chunks and embeds it server-side in one batch (the name sets the file type)
+        paper_file = io.BytesIO(paper_content.encode('utf-8'))
+        paper_file.name = "paper.txt"
+        self.client.vector_stores.file_batches.upload_and_poll(
+            vector_store_id=vector_store.id,
+            files=[paper_file]
+        )
         
+        self._record_vector_store(index_key, vector_store.id)
         return vector_store.id
     
-    def _create_paper_vector_store_from_file(self, paper_path: str) -> str:
+    def _create_paper_vector_store_from_file(self, paper_path: str, paper_hash: Optional[str] = None) -> str:
         """Create a vector store for the physics paper from original PDF file."""
-        # Create vector store
+        if paper_hash is None:
+            paper_hash = self._hash_paper(path=paper_path)
+        
+        # Reuse the store built from the same PDF in an earlier run
+        index_key = f"paper:{paper_hash}"
+        vector_store_id = self._lookup_vector_store(index_key)
+        if vector_store_id:
+            return vector_store_id
+        
+        # Create vector store, named by content hash so it can be traced to its paper
         vector_store = self.client.vector_stores.create(
-            name="Physics Paper"
+            name=f"paper-{paper_hash[:12]}"
         )
         
-        # Upload the original PDF file directly
-        with open(paper_path, 'rb') as f:
-            file_batch = self.client.vector_stores.file_batches.upload_and_poll(
+        # Upload the original PDF, from memory if the caller already mapped it
+        # (the client takes bytes, not an mmap, so it is sliced once)
+        if paper_path == self.paper_path and self.pdf_bytes is not None:
+            self.client.vector_stores.file_batches.upload_and_poll(
                 vector_store_id=vector_store.id,
-                files=[f]
+                files=[(os.path.basename(paper_path), self.pdf_bytes[:])]
             )
+        else:
+            with open(paper_path, 'rb') as f:
+                self.client.vector_stores.file_batches.upload_and_poll(
+                    vector_store_id=vector_store.id,
+                    files=[f]
+                )
         
+        self._record_vector_store(index_key, vector_store.id)
         return vector_store.id
     
     def _run_assistant_with_file_search(self, assistant_id: str, messages: list, 
                                       vector_store_id: str = None) -> str:
         """Run an assistant with file search capability."""
-        # Create thread with vector store if provided
-        thread_params = {}
+        # Thread, messages and vector store are sent along with the run in one request
+        thread_params = {
+            "messages": [{"role": message["role"], "content": message["content"]}
+                         for message in messages]
+        }
         if vector_store_id:
             thread_params["tool_resources"] = {
                 "file_search": {
@@ -266,71 +499,108 @@ Only output the JSON, no additional text."""
                 }
             }
         
-        thread = self.client.beta.threads.create(**thread_params)
+        # Stream the run so completion arrives as an event instead of being polled
+        with self.client.beta.threads.create_and_run_stream(
+            assistant_id=assistant_id,
+            thread=thread_params
+        ) as stream:
+            stream.until_done()
+            run = stream.current_run
+            final_messages = stream.get_final_messages()
         
-        # Add messages to thread
-        for message in messages:
-            self.client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role=message["role"],
-                content=message["content"]
-            )
+        # The stream can close before the run settles; fall back to polling
+        if run is not None and run.status not in TERMINAL_RUN_STATUSES:
+            run = self._wait_for_run(run.thread_id, run)
+            final_messages = self.client.beta.threads.messages.list(thread_id=run.thread_id).data
         
-        # Run the assistant
-        run = self.client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant_id
-        )
+        if run is None or run.status != "completed":
+            status = run.status if run is not None else "unknown"
+            raise RuntimeError(f"Assistant run failed with status: {status}")
         
-        # Wait for completion with timeout
-        max_wait = 300  # 5 minutes timeout
+        # Get the response
+        for msg in final_messages:
+            if msg.role == "assistant":
+                return msg.content[0].text.value
+        
+        raise ValueError("No assistant response found")
+    
+    def _wait_for_run(self, thread_id: str, run, max_wait: float = 300):
+        """Poll a run with exponential backoff until it reaches a terminal status."""
         start_time = time.time()
+        attempt = 0
         
-        while run.status not in ["completed", "failed", "cancelled"]:
+        while run.status not in TERMINAL_RUN_STATUSES:
             if time.time() - start_time > max_wait:
-                self.client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
+                self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
                 raise TimeoutError("Assistant run timed out")
             
-            time.sleep(2)
+            # 250 ms growing by 1.5x per attempt, capped at 2 s
+            time.sleep(min(2.0, 0.25 * 1.5 ** attempt))
+            attempt += 1
             run = self.client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
+                thread_id=thread_id,
                 run_id=run.id
             )
         
-        if run.status != "completed":
-            raise Exception(f"Assistant run failed with status: {run.status}")
-        
-        # Get the response
-        messages = self.client.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data:
-            if msg.role == "assistant":
-                return msg.content[0].text.value
-        
-        raise ValueError("No assistant response found")
+        return run
     
-    def retrieve_parameters(self, paper_content: str, custom_prompt: str = None) -> Tuple[Dict[str, Any], str]:
-        """Extract parameters using the two-agent RAG system."""
-        reasoning_log = []
+    def retrieve_parameters(self, paper_content: str, custom_prompt: str = None,
+                            log_sink: Optional[TextIO] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        Extract parameters using the two-agent RAG system.
+        
+        Args:
+            paper_content: Paper text (used when no paper_path PDF is available)
+            custom_prompt: Extra instruction passed to the physics expert
+            log_sink: Optional text stream that receives reasoning entries as they are produced
+            
+        Returns:
+            Tuple of (parameters, reasoning)
+        """
+        # Repeat calls for the same paper and instruction reuse the completed result
+        # The paper is hashed once here and reused for the vector store as well
+        use_pdf = bool(self.paper_path and os.path.exists(self.paper_path))
+        if use_pdf:
+            paper_hash = self._hash_paper(path=self.paper_path)
+        else:
+            paper_hash = self._hash_paper(content=paper_content)
+        cache_key = (paper_hash, custom_prompt, self.max_iterations)
+        if cache_key in self._result_cache:
+            final_params, reasoning = self._result_cache[cache_key]
+            self.last_result_complete = True
+            if log_sink is not None:
+                log_sink.write(reasoning)
+                log_sink.write("\n")
+            return copy.deepcopy(final_params), reasoning
+        
+        # Reasoning entries are written to one buffer instead of joined from a list
+        reasoning_buf = io.StringIO()
+        
+        def log(entry: str) -> None:
+            reasoning_buf.write(entry)
+            reasoning_buf.write("\n")
+            if log_sink is not None:
+                log_sink.write(entry)
+                log_sink.write("\n")
         
         # Create vector store for the paper
-        reasoning_log.append("=== Creating Paper Vector Store ===")
-        if self.paper_path and os.path.exists(self.paper_path):
-            paper_vector_store_id = self._create_paper_vector_store_from_file(self.paper_path)
-            reasoning_log.append(f"Created vector store from PDF file: {self.paper_path}")
+        log("=== Creating Paper Vector Store ===")
+        if use_pdf:
+            paper_vector_store_id = self._create_paper_vector_store_from_file(self.paper_path, paper_hash)
+            log(f"Created vector store from PDF file: {self.paper_path}")
         else:
-            paper_vector_store_id = self._create_paper_vector_store(paper_content)
-            reasoning_log.append(f"Created vector store from text content")
+            paper_vector_store_id = self._create_paper_vector_store(paper_content, paper_hash)
+            log(f"Created vector store from text content")
         
         # Step 1: Physics expert reads the paper with file search
-        reasoning_log.append("\n=== Physics Expert Analysis with File Search ===")
+        log("\n=== Physics Expert Analysis with File Search ===")
         
         # Build the physics expert query
-        physics_query = """Please use file search to extract MP-Gadget simulation parameters from the uploaded paper. 
-Search for specific values and cite where you found them in the paper."""
+        physics_query = PHYSICS_QUERY
         
         if custom_prompt:
             physics_query += f"\n\nIMPORTANT INSTRUCTION: {custom_prompt}"
-            reasoning_log.append(f"Custom instruction: {custom_prompt}")
+            log(f"Custom instruction: {custom_prompt}")
         
         physics_response = self._run_assistant_with_file_search(
             self.physics_expert_id,
@@ -340,163 +610,167 @@ Search for specific values and cite where you found them in the paper."""
             }],
             vector_store_id=paper_vector_store_id
         )
-        reasoning_log.append(physics_response)
+        log(physics_response)
         
         # Step 2: Formatter agent processes with MP-Gadget documentation
-        reasoning_log.append("\n=== MP-Gadget Formatter Processing with Documentation ===")
+        log("\n=== MP-Gadget Formatter Processing with Documentation ===")
         formatter_response = self._run_assistant_with_file_search(
             self.formatter_id,
             [{
                 "role": "user", 
-                "content": f"""Please format these extracted parameters for MP-Gadget.
-Use file search to check the MP-Gadget documentation for proper parameter names, formats, and requirements.
-
-Extracted parameters:
-{physics_response}"""
+                "content": FORMATTER_TEMPLATE.format(physics_response=physics_response)
             }]
         )
-        reasoning_log.append(formatter_response)
+        log(formatter_response)
         
         # Step 3: Iterative refinement - let formatter decide when complete
         iteration = 0
         
-        while iteration < self.max_iterations + 1:
+        while True:
+            # Parse formatter response once per round
             try:
-                # Parse formatter response
                 parameters = self._extract_json_from_response(formatter_response)
-                
-                # Check if formatter says it's complete
-                if parameters.get("status") == "complete":
-                    # Formatter is satisfied with all parameters
-                    reasoning = "\n".join(reasoning_log)
-                    # Clean up paper vector store (but keep MP-Gadget manual vector store)
-                    try:
-                        self.client.vector_stores.delete(vector_store_id=paper_vector_store_id)
-                    except Exception as e:
-                        reasoning_log.append(f"Warning: Failed to delete paper vector store {paper_vector_store_id}: {e}")
-                    
-                    # Remove status and missing_parameters from final output
-                    final_params = {
-                        "genic": parameters.get("genic", {}),
-                        "gadget": parameters.get("gadget", {}),
-                        "comment": parameters.get("comment", "")
-                    }
-                    return final_params, reasoning
-                
+            except ValueError as e:
+                parameters = None
+                log(f"Error in iteration {iteration}: {str(e)}")
+            
+            # Stop as soon as the formatter is satisfied with all parameters; an
+            # unparseable response would fail identically in every later round
+            if parameters is None or parameters.get("status") == "complete":
+                break
+            if iteration >= self.max_iterations + 1:
+                break
+            
+            try:
                 # Formatter says incomplete - resolve missing parameters
-                missing_params = parameters.get("missing_parameters", [])
-                reasoning_log.append(f"\n=== Iteration {iteration + 1}: Resolving Missing Parameters ===")
-                reasoning_log.append(f"Missing: {', '.join(missing_params)}")
+                missing_params = parameters.get("missing_parameters") or []
+                if not isinstance(missing_params, list):
+                    missing_params = [missing_params]
+                missing_params = [str(param) for param in missing_params]
+                log(f"\n=== Iteration {iteration + 1}: Resolving Missing Parameters ===")
+                log(f"Missing: {', '.join(missing_params)}")
                 
-                # Formatter searches documentation for missing parameters
-                doc_search_request = f"""The following parameters are missing:
-{chr(10).join(missing_params)}
-
-Please search the MP-Gadget documentation to find:
-1. Descriptions of these parameters
-2. How they can be calculated or derived
-3. Default values if applicable
-4. Whether they are truly required or optional"""
+                missing = "\n".join(missing_params)
                 
-                doc_search_response = self._run_assistant_with_file_search(
-                    self.formatter_id,
-                    [{"role": "user", "content": doc_search_request}]
+                # Physics expert provides missing parameters based on the paper
+                clarification_request = CLARIFICATION_TEMPLATE.format(
+                    missing=missing,
+                    physics_response=physics_response
                 )
-                reasoning_log.append(f"Documentation Search:\n{doc_search_response}")
-                
-                # Physics expert provides missing parameters based on paper and requirements
-                clarification_request = f"""Based on the documentation requirements and the paper content, please provide the missing parameters:
-{chr(10).join(missing_params)}
-
-Documentation guidance:
-{doc_search_response}
-
-Search the paper again for these specific parameters or values that can be used to calculate them.
-Original extracted parameters:
-{physics_response}"""
                 
                 physics_clarification = self._run_assistant_with_file_search(
                     self.physics_expert_id,
                     [{"role": "user", "content": clarification_request}],
                     vector_store_id=paper_vector_store_id
                 )
-                reasoning_log.append(f"Physics Expert Clarification:\n{physics_clarification}")
+                log(f"Physics Expert Clarification:\n{physics_clarification}")
                 
-                # Final formatting with all information
+                # Formatter searches the documentation for the missing parameters and
+                # produces the final configuration in the same run
                 formatter_response = self._run_assistant_with_file_search(
                     self.formatter_id,
                     [{
                         "role": "user", 
-                        "content": f"""Please create the final MP-Gadget parameter configuration using all available information.
-Verify against documentation that all required parameters are included.
-
-Original parameters:
-{formatter_response}
-
-Additional clarification:
-{physics_clarification}
-
-Ensure the format matches MP-Gadget documentation requirements."""
+                        "content": FINAL_FORMATTER_TEMPLATE.format(
+                            missing=missing,
+                            formatter_response=formatter_response,
+                            physics_clarification=physics_clarification
+                        )
                     }]
                 )
-                reasoning_log.append(f"Updated Formatter Response:\n{formatter_response}")
+                log(f"Updated Formatter Response:\n{formatter_response}")
                 
-            except Exception as e:
-                reasoning_log.append(f"Error in iteration {iteration}: {str(e)}")
+            except (OpenAIError, RuntimeError, TimeoutError, ValueError) as e:
+                log(f"Error in iteration {iteration}: {str(e)}")
             
             iteration += 1
         
-        # Clean up paper vector store (but keep MP-Gadget manual vector store)
-        try:
-            self.client.vector_stores.delete(vector_store_id=paper_vector_store_id)
-        except Exception as e:
-            reasoning_log.append(f"Warning: Failed to delete paper vector store {paper_vector_store_id}: {e}")
+        # Clean up paper vector store (but keep MP-Gadget manual vector store) off the
+        # return path; the retrieval has already finished
+        if self.delete_paper_vector_store:
+            self._delete_vector_store_in_background(paper_vector_store_id)
         
-        # Return final parameters
-        try:
-            parameters = self._extract_json_from_response(formatter_response)
+        # Remove status and missing_parameters from final output
+        if parameters is None:
+            final_params = {
+                "genic": {},
+                "gadget": {},
+                "comment": "Extraction failed - could not parse formatter response"
+            }
+        elif parameters.get("status") == "complete":
             final_params = {
                 "genic": parameters.get("genic", {}),
                 "gadget": parameters.get("gadget", {}),
-                "comment": parameters.get("comment", "Failed to extract all required parameters after maximum iterations")
+                "comment": parameters.get("comment", "")
             }
-        except:
+        else:
             final_params = {
-                "genic": {},
-                "gadget": {},
-                "comment": "Extraction failed - could not parse formatter response"
+                "genic": parameters.get("genic", {}),
+                "gadget": parameters.get("gadget", {}),
+                "comment": parameters.get("comment", "Failed to extract all required parameters after maximum iterations")
             }
         
-        reasoning = "\n".join(reasoning_log)
+        reasoning = reasoning_buf.getvalue()[:-1]
+        self.last_result_complete = parameters is not None and parameters.get("status") == "complete"
+        if self.last_result_complete:
+            self._result_cache[cache_key] = (copy.deepcopy(final_params), reasoning)
         return final_params, reasoning
     
+    def _delete_vector_store_in_background(self, vector_store_id: str) -> None:
+        """
+        Delete a vector store on a background thread so callers do not wait on it.
+        
+        The thread is not a daemon, so the interpreter finishes the deletion before
+        exiting; cleanup() also waits for pending deletions. The retrieval has
+        already returned by then, so a failure is reported as a warning rather
+        than in its reasoning.
+        """
+        def delete():
+            try:
+                self._delete_vector_store(vector_store_id)
+            except OpenAIError as e:
+                print(f"Warning: Failed to delete paper vector store {vector_store_id}: {e}")
+        
+        self._pending_deletions = [thread for thread in self._pending_deletions if thread.is_alive()]
+        thread = threading.Thread(target=delete)
+        thread.start()
+        self._pending_deletions.append(thread)
+    
     def _extract_json_from_response(self, response: str) -> Dict[str, Any]:
-        """Extract JSON from assistant response."""
-        import re
+        """Extract a JSON object from assistant response."""
+        parsed = None
         
         # Try direct JSON parsing
         try:
-            return json.loads(response)
-        except:
+            parsed = json.loads(response)
+        except json.JSONDecodeError:
             pass
         
-        # Try to find JSON in the response
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group())
-            except:
-                pass
-        
-        # Try to find JSON in code blocks
-        code_block_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response, re.DOTALL)
-        if code_block_match:
-            try:
-                return json.loads(code_block_match.group(1))
-            except:
-                pass
-        
-        raise ValueError("Could not extract JSON from response")
+        # Try to find JSON in code blocks (most specific, and skips trailing prose)
+        if not isinstance(parsed, dict):
+            code_block_match = JSON_BLOCK_PATTERN.search(response)
+            if code_block_match:
+                try:
+                    parsed = json.loads(code_block_match.group(1))
+                except json.JSONDecodeError:
+                    pass
+        
+        # Try each balanced {...} span in the response
+        if not isinstance(parsed, dict):
+            span = _find_balanced_json(response)
+            while span:
+                begin, end = span
+                try:
+                    parsed = json.loads(response[begin:end])
+                    break
+                except json.JSONDecodeError:
+                    span = _find_balanced_json(response, begin + 1)
+        
+        if parsed is None:
+            raise ValueError("Could not extract JSON from response")
+        if not isinstance(parsed, dict):
+            raise ValueError(f"Expected a JSON object in response, got {type(parsed).__name__}")
+        return parsed
     
     def validate_parameters(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Override to work with our JSON format that includes comment field."""
@@ -505,16 +779,22 @@ Ensure the format matches MP-Gadget documentation requirements."""
     
     def cleanup(self) -> None:
         """Clean up resources including vector stores."""
+        # Let background paper vector store deletions finish
+        for thread in getattr(self, '_pending_deletions', []):
+            thread.join()
+        self._pending_deletions = []
+        
         try:
-            if hasattr(self, 'formatter_vector_store_id') and self.formatter_vector_store_id:
-                self.client.vector_stores.delete(vector_store_id=self.formatter_vector_store_id)
+            vector_store_id = getattr(self, 'formatter_vector_store_id', None)
+            if vector_store_id and vector_store_id not in self._persistent_vector_store_ids:
+                self.client.vector_stores.delete(vector_store_id=vector_store_id)
                 print(f"Cleaned up formatter vector store: {self.formatter_vector_store_id}")
-        except Exception as e:
+        except OpenAIError as e:
             print(f"Warning: Failed to delete formatter vector store: {e}")
     
-    def __del__(self):
-        """Destructor to ensure cleanup on object deletion."""
-        try:
-            self.cleanup()
-        except:
-            pass
\ No newline at end of file
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
\ No newline at end of file
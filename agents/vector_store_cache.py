@@ -0,0 +1,153 @@
+"""
+Persistent index of OpenAI vector stores keyed by the content hash of the files
+they were built from, so identical inputs can reuse an existing store across
+processes instead of being uploaded and embedded again.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locking, index writes are best-effort
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # orjson parses large indexes much faster, but json still works
+    orjson = None
+
+
+VS_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "simagents", "vs_index.json")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """
+    Compute the SHA-256 of a file, reading it in 1 MiB chunks.
+
+    Args:
+        path: File to hash
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_files(paths: Iterable[str], index_path: Optional[str] = None) -> str:
+    """
+    Compute a combined hash over a set of files, independent of their order.
+
+    With an index_path, each file's digest is memoized in the index under its
+    absolute path, size and mtime, so unchanged files are not read again by
+    later runs.
+
+    Args:
+        paths: Files to hash
+        index_path: JSON index used to memoize per-file digests (None to always read)
+
+    Returns:
+        Hex digest over the sorted (file name, SHA-256) pairs
+    """
+    paths = list(paths)
+    known = {}
+    if index_path:
+        try:
+            known = load_index(index_path)
+        except OSError as e:
+            print(f"Warning: Could not read file hash index {index_path}: {e}")
+            index_path = None
+
+    entries = []
+    updates = {}
+    for path in paths:
+        stat = os.stat(path)
+        key = f"file:{os.path.abspath(path)}"
+        entry = known.get(key)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            digest = entry["sha256"]
+        else:
+            digest = hash_file(path)
+            updates[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        entries.append((os.path.basename(path), digest))
+
+    if index_path and updates:
+        try:
+            update_index(index_path, updates)
+        except OSError as e:
+            print(f"Warning: Could not write file hash index {index_path}: {e}")
+
+    return hashlib.sha256(json.dumps(sorted(entries)).encode('utf-8')).hexdigest()
+
+
+def _locked_update(index_path: str, updates: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Read the index, merging in updates, under an exclusive file lock."""
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+
+    with open(index_path, 'a+', encoding='utf-8') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            content = f.read()
+            try:
+                if not content:
+                    entries = {}
+                elif orjson is not None:
+                    entries = orjson.loads(content)
+                else:
+                    entries = json.loads(content)
+            except json.JSONDecodeError:  # orjson.JSONDecodeError is a subclass
+                entries = {}
+
+            if updates:
+                entries.update(updates)
+                f.seek(0)
+                f.truncate()
+                json.dump(entries, f, indent=2)
+                f.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    return entries
+
+
+def load_index(index_path: str) -> Dict[str, Any]:
+    """
+    Load all entries of an index file (empty if it does not exist yet).
+
+    Args:
+        index_path: Path to the JSON index
+
+    Returns:
+        Mapping of cache key to entry
+    """
+    if not os.path.exists(index_path):
+        return {}
+    return _locked_update(index_path, None)
+
+
+def update_index(index_path: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add or replace entries in an index file.
+
+    The read-modify-write holds an exclusive lock so concurrent pipeline
+    workers do not clobber each other's entries.
+
+    Args:
+        index_path: Path to the JSON index
+        updates: Entries to add or replace
+
+    Returns:
+        All entries after the update
+    """
+    return _locked_update(index_path, updates)
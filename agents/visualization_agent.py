@@ -1,8 +1,17 @@
-from typing import Optional, Any, List
+from typing import Optional, Any, List, Tuple
+import mmap
 import os
-import glob
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # Plots are only ever saved to files; skip interactive backends
 import matplotlib.pyplot as plt
+try:
+    import pandas as pd
+except ImportError:  # pandas' C parser is much faster, but np.loadtxt still works
+    pd = None
 from pathlib import Path
 from autogen import LLMConfig
 from agents.base_agent import BaseAgent
@@ -27,6 +36,261 @@ Always use matplotlib for plotting and ensure proper scientific formatting.
 Reply 'TERMINATE' when the visualization is complete.
 """
 
+# Power spectrum plotting requests; {{scale_factor}} renders as a literal placeholder
+SINGLE_REDSHIFT_MESSAGE_TEMPLATE = """Plot the power spectrum at redshift z={redshift} from the simulation output directory: {output_dir}
+
+Load the powerspectrum-{{scale_factor}}.txt files where scale_factor = 1/(1+z).
+Use matplotlib to create a loglog plot with:
+- X-axis: k [h/Mpc] 
+- Y-axis: P(k) [(Mpc/h)³]
+- Label the redshift on the plot
+- Save as {output_filename}
+
+Find the file with scale factor closest to {scale_factor} for redshift {redshift}."""
+
+ALL_REDSHIFTS_MESSAGE_TEMPLATE = """Plot all available power spectra from the simulation output directory: {output_dir}
+
+Load all powerspectrum-{{scale_factor}}.txt files and plot them together.
+For each file:
+1. Extract scale_factor from filename
+2. Calculate redshift = 1/scale_factor - 1
+3. Load the k and P(k) data
+4. Plot using matplotlib loglog scale
+
+Create a plot with:
+- X-axis: k [h/Mpc]
+- Y-axis: P(k) [(Mpc/h)³]  
+- Legend showing redshift for each curve
+- Save as {output_filename}
+
+Use different colors/styles for each redshift."""
+
+# Read once at import (workflows call load_dotenv() before importing agents)
+DEFAULT_API_KEY = os.environ.get("OPENAI_API_KEY")
+
+# Below this size np.fromfile parses power spectra faster than pandas' reader setup
+SMALL_SPECTRUM_BYTES = 1024 * 1024
+
+POWER_SPECTRUM_PREFIX = "powerspectrum-"
+POWER_SPECTRUM_SUFFIX = ".txt"
+
+
+def scale_factor_to_redshift(scale_factors: Any) -> np.ndarray:
+    """
+    Convert scale factors to redshifts, z = 1/a - 1, in one vectorized pass.
+    
+    Args:
+        scale_factors: Scale factors (any array-like); NaN entries stay NaN
+        
+    Returns:
+        float64 array of redshifts
+    """
+    with np.errstate(divide='ignore'):
+        redshifts = np.reciprocal(np.asarray(scale_factors, dtype=np.float64))
+    redshifts -= 1.0
+    return redshifts
+
+
+@lru_cache(maxsize=64)
+def _load_power_spectrum(path: str, mtime: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load the k and P(k) columns of a power spectrum file.
+    
+    Results are cached per (path, mtime), so re-plots skip parsing unless the file changed.
+    The parsed columns are also saved to a {path}.npy sidecar, which later processes
+    memory-map instead of parsing the text again.
+    
+    Args:
+        path: powerspectrum-{scale_factor}.txt file
+        mtime: Modification time of the file
+        
+    Returns:
+        Tuple of (k, P_k) read-only arrays
+    """
+    npy_path = path + ".npy"
+    try:
+        if os.path.getmtime(npy_path) >= mtime:
+            data = np.load(npy_path, mmap_mode='r')
+            return data[:, 0], data[:, 1]
+    except (OSError, ValueError):
+        pass  # No sidecar yet, or an unreadable one: parse the text file
+    
+    data = _parse_power_spectrum(path)
+    _save_sidecar(npy_path, data)
+    
+    # Cached arrays are shared between calls, so guard them against in-place edits
+    data.flags.writeable = False
+    return data[:, 0], data[:, 1]
+
+
+def _parse_power_spectrum(path: str) -> np.ndarray:
+    """
+    Parse the first two columns of a power spectrum text file into an (n, 2) array.
+    
+    Small files go through np.fromfile, which has no per-call setup cost; pandas' C
+    reader wins once files pass SMALL_SPECTRUM_BYTES, and np.loadtxt is the fallback.
+    
+    Args:
+        path: powerspectrum-{scale_factor}.txt file
+        
+    Returns:
+        float64 array of (k, P_k) rows
+    """
+    if pd is None or os.path.getsize(path) < SMALL_SPECTRUM_BYTES:
+        data = _read_with_fromfile(path)
+        if data is not None:
+            return data
+    
+    if pd is not None:
+        df = pd.read_csv(path, sep=r'\s+', comment='#', header=None, usecols=[0, 1],
+                         engine='c', dtype=np.float64)
+        return df.to_numpy()
+    return np.loadtxt(path, usecols=(0, 1), ndmin=2)
+
+
+def _read_with_fromfile(path: str) -> Optional[np.ndarray]:
+    """Read a whitespace-separated table after its '#' header with np.fromfile (None if irregular)."""
+    with open(path, 'rb') as f:
+        # Skip the leading comment block and count columns on the first data row
+        while True:
+            pos = f.tell()
+            line = f.readline()
+            if not line:
+                return None
+            stripped = line.strip()
+            if stripped and not stripped.startswith(b'#'):
+                break
+        ncols = len(stripped.split())
+        if ncols < 2 or b'#' in stripped:
+            return None
+        
+        f.seek(pos)
+        # fromfile only warns when it stops early on text it cannot parse (e.g. a
+        # trailing comment); treat that as irregular input for the general parser
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("error", DeprecationWarning)
+                values = np.fromfile(f, dtype=np.float64, sep=' ')
+        except (DeprecationWarning, ValueError):
+            return None
+    
+    if values.size == 0 or values.size % ncols:
+        return None
+    return values.reshape(-1, ncols)[:, :2].copy()
+
+
+@lru_cache(maxsize=128)
+def _load_snapshots(path: str, mtime: float) -> Tuple[float, ...]:
+    """
+    Load the scale factors (second column) of a Snapshots.txt file.
+    
+    Cached per (path, mtime); np.loadtxt handles well-formed files, and the
+    line-by-line parser is only used when it rejects the file.
+    
+    Args:
+        path: Snapshots.txt file
+        mtime: Modification time of the file (cache key only)
+        
+    Returns:
+        Tuple of scale factors
+    """
+    try:
+        return tuple(np.loadtxt(path, usecols=1, comments='#', ndmin=1).tolist())
+    except (ValueError, IndexError):
+        pass
+    
+    scale_factors = []
+    if os.path.getsize(path) == 0:
+        return ()
+    
+    # Map the file and split it in one call rather than iterating lines in Python
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            lines = mm[:].splitlines()
+    
+    for raw_line in lines:
+        line = raw_line.strip()
+        if line and not line.startswith(b'#'):
+            parts = line.split()
+            if len(parts) >= 2:
+                try:
+                    # Load the number in the second column
+                    scale_factors.append(float(parts[1]))
+                except ValueError:
+                    print(f"Warning: Could not parse scale factor from line: {line.decode(errors='replace')}")
+    return tuple(scale_factors)
+
+
+def _matches_any(sorted_targets: np.ndarray, value: float, tolerance: float, relative: bool = False) -> bool:
+    """
+    Check whether value is within tolerance of any target, by bisecting a sorted array.
+    
+    Only the neighbours on either side of value can be closest, in both the absolute
+    and the relative (|value - t| / t) sense, so two comparisons suffice.
+    
+    Args:
+        sorted_targets: Targets sorted in ascending order
+        value: Value to look up
+        tolerance: Allowed difference
+        relative: Compare |value - t| / t instead of |value - t|
+        
+    Returns:
+        True if some target is within tolerance
+    """
+    i = int(np.searchsorted(sorted_targets, value))
+    for j in (i - 1, i):
+        if 0 <= j < len(sorted_targets):
+            target = sorted_targets[j]
+            diff = abs(value - target)
+            if (diff / target if relative else diff) < tolerance:
+                return True
+    return False
+
+
+def _passes_filters(
+    scale_factor: float,
+    redshift: float,
+    sorted_scale_factors: Optional[np.ndarray],
+    sorted_redshifts: Optional[np.ndarray]
+) -> bool:
+    """
+    Check a power spectrum file against the Snapshots.txt and redshift filters.
+    
+    Args:
+        scale_factor: Scale factor parsed from the file name
+        redshift: Redshift corresponding to scale_factor
+        sorted_scale_factors: Sorted scale factors from Snapshots.txt (None to accept all)
+        sorted_redshifts: Sorted redshifts to keep (None to accept all)
+        
+    Returns:
+        True if the file should be plotted
+    """
+    # Closest scale factor in Snapshots.txt must be within 1% tolerance
+    if sorted_scale_factors is not None:
+        if not _matches_any(sorted_scale_factors, scale_factor, 0.01, relative=True):
+            return False
+    
+    # Filter by specific redshifts if provided
+    if sorted_redshifts is not None:
+        if not _matches_any(sorted_redshifts, redshift, 0.1):
+            return False
+    return True
+
+
+def _save_sidecar(npy_path: str, data: np.ndarray) -> None:
+    """Atomically write a .npy sidecar; failures (e.g. read-only output dirs) are ignored."""
+    tmp_path = f"{npy_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, npy_path)
+    except OSError as e:
+        print(f"Warning: Could not write {npy_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
 
 class VisualizationAgent(BaseAgent):
     """Agent for creating power spectrum visualizations from MP-Gadget simulation outputs."""
@@ -47,12 +311,11 @@ class VisualizationAgent(BaseAgent):
         """
         # Set default LLM config for reproducibility if none provided
         if llm_config is None:
-            import os
             llm_config = {
                 "model": "gpt-4o",
                 "temperature": 0.01,
                 "top_p": 0.1,
-                "api_key": os.environ.get("OPENAI_API_KEY")
+                "api_key": DEFAULT_API_KEY or os.environ.get("OPENAI_API_KEY")
             }
         
         super().__init__(
@@ -62,6 +325,10 @@ class VisualizationAgent(BaseAgent):
             is_termination_msg=lambda x: x.get("content", "").rstrip().endswith("TERMINATE"),
             **kwargs
         )
+        
+        # Figure reused across plot_power_spectrum calls (created on first use)
+        self._fig = None
+        self._ax = None
     
     def setup(self) -> None:
         """Setup the visualization agent."""
@@ -110,30 +377,34 @@ class VisualizationAgent(BaseAgent):
             List of scale factors from second column of Snapshots.txt
         """
         snapshots_file = os.path.join(output_dir, "Snapshots.txt")
-        scale_factors = []
         
         if not os.path.exists(snapshots_file):
             print(f"Warning: Snapshots.txt not found in {output_dir}")
-            return scale_factors
+            return []
         
         try:
-            with open(snapshots_file, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            try:
-                                # Load the number in the second column
-                                scale_factor = float(parts[1])
-                                scale_factors.append(scale_factor)
-                            except ValueError:
-                                print(f"Warning: Could not parse scale factor from line: {line}")
+            return list(_load_snapshots(snapshots_file, os.path.getmtime(snapshots_file)))
         except Exception as e:
             print(f"Warning: Could not read Snapshots.txt: {e}")
-        
-        return scale_factors
+            return []
 
+    def _load_power_spectrum_entry(self, file: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Load one power spectrum file.
+        
+        Args:
+            file: powerspectrum-{scale_factor}.txt file
+            
+        Returns:
+            Tuple of (k, P_k), or None if the file could not be parsed
+        """
+        try:
+            # Load power spectrum data (wavenumber, power spectrum)
+            return _load_power_spectrum(file, os.path.getmtime(file))
+        except (ValueError, IndexError) as e:
+            print(f"Warning: Could not process file {file}: {e}")
+            return None
+    
     def plot_power_spectrum(
         self,
         output_dir: str,
@@ -160,72 +431,95 @@ class VisualizationAgent(BaseAgent):
             if target_scale_factors:
                 print(f"Found {len(target_scale_factors)} scale factors in Snapshots.txt: {target_scale_factors}")
         
-        # Find all power spectrum files
-        pattern = os.path.join(output_dir, "powerspectrum-*.txt")
-        files = glob.glob(pattern)
+        # Find all power spectrum files, parsing the scale factor from each name in the
+        # same pass: powerspectrum-0.333333.txt -> 0.333333
+        files = []
+        try:
+            with os.scandir(output_dir) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if not (name.startswith(POWER_SPECTRUM_PREFIX) and name.endswith(POWER_SPECTRUM_SUFFIX)):
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        scale_factor = float(name[len(POWER_SPECTRUM_PREFIX):-len(POWER_SPECTRUM_SUFFIX)])
+                    except ValueError as e:
+                        print(f"Warning: Could not process file {entry.path}: {e}")
+                        continue
+                    files.append((scale_factor, entry.path))
+        except FileNotFoundError:
+            pass
         
         if not files:
             raise FileNotFoundError(f"No power spectrum files found in {output_dir}")
         
-        # Extract scale factors and calculate redshifts
-        data_list = []
-        for file in files:
-            filename = os.path.basename(file)
-            # Extract scale factor from filename: powerspectrum-0.333333.txt -> 0.333333
-            scale_factor_str = filename.replace("powerspectrum-", "").replace(".txt", "")
-            try:
-                scale_factor = float(scale_factor_str)
-                redshift = 1.0 / scale_factor - 1.0
-                
-                # Filter by Snapshots.txt scale factors if available
-                if target_scale_factors is not None:
-                    # Find closest scale factor in Snapshots.txt (within 1% tolerance)
-                    if not any(abs(scale_factor - target_sf) / target_sf < 0.01 for target_sf in target_scale_factors):
-                        continue
-                
-                # Filter by specific redshifts if provided
-                if specific_redshifts is not None:
-                    if not any(abs(redshift - z) < 0.1 for z in specific_redshifts):
-                        continue
-                
-                # Load power spectrum data
-                data = np.loadtxt(file)
-                k = data[:, 0]  # wavenumber
-                P_k = data[:, 1]  # power spectrum
-                
-                data_list.append({
-                    'k': k,
-                    'P_k': P_k,
-                    'redshift': redshift,
-                    'scale_factor': scale_factor,
-                    'file': file
-                })
-            except (ValueError, IndexError) as e:
-                print(f"Warning: Could not process file {file}: {e}")
-                continue
-        
-        if not data_list:
+        # Sorted copies of the filters so each file is matched by bisection
+        sorted_scale_factors = None
+        if target_scale_factors is not None:
+            sorted_scale_factors = np.sort(np.asarray(target_scale_factors, dtype=np.float64))
+        sorted_redshifts = None
+        if specific_redshifts is not None:
+            sorted_redshifts = np.sort(np.asarray(specific_redshifts, dtype=np.float64))
+        
+        # Calculate all redshifts at once and order files from highest to lowest redshift
+        scale_factors = np.fromiter((sf for sf, _ in files), dtype=np.float64, count=len(files))
+        paths = [path for _, path in files]
+        redshifts = scale_factor_to_redshift(scale_factors)
+        order = np.argsort(-redshifts, kind='stable')
+        
+        # Apply the filters before any I/O so rejected files are never opened
+        candidates = [
+            i for i in order
+            if _passes_filters(scale_factors[i], redshifts[i], sorted_scale_factors, sorted_redshifts)
+        ]
+        
+        # A single requested redshift only needs the closest matching snapshot: pick it
+        # by name among the files that passed the filters, so just that one is parsed
+        if candidates and specific_redshifts is not None and len(specific_redshifts) == 1:
+            candidates = [min(candidates, key=lambda i: abs(redshifts[i] - specific_redshifts[0]))]
+        
+        # Load the files in parallel; the parsers release the GIL, so threads overlap
+        # the I/O and parsing
+        loaded = []
+        if candidates:
+            with ThreadPoolExecutor(max_workers=min(16, len(candidates))) as executor:
+                spectra = executor.map(lambda i: self._load_power_spectrum_entry(paths[i]), candidates)
+                loaded = [(i, spectrum) for i, spectrum in zip(candidates, spectra) if spectrum is not None]
+        
+        if not loaded:
             if target_scale_factors:
                 raise ValueError(f"No power spectrum files found matching scale factors from Snapshots.txt: {target_scale_factors}")
             else:
                 raise ValueError("No valid power spectrum data found")
         
-        # Sort by redshift (highest to lowest)
-        data_list.sort(key=lambda x: x['redshift'], reverse=True)
-        
-        # Create the plot
-        plt.figure(figsize=(10, 8))
+        # Create the plot once and clear it on later calls, so fonts and transforms
+        # are not set up again (constrained layout replaces a tight_layout pass)
+        if self._fig is None:
+            self._fig, self._ax = plt.subplots(figsize=(10, 8), constrained_layout=True)
+        else:
+            self._ax.clear()
+        fig, ax = self._fig, self._ax
         
-        for data in data_list:
-            label = f"z = {data['redshift']:.2f}"
-            plt.loglog(data['k'], data['P_k'], label=label, linewidth=2)
+        for i, (k, P_k) in loaded:
+            label = f"z = {redshifts[i]:.2f}"
+            # float32 is plenty for pixel positions and halves what matplotlib transforms;
+            # the redshift in the label stays float64
+            k = k.astype(np.float32, copy=False)
+            P_k = P_k.astype(np.float32, copy=False)
+            # Drop non-positive bins up front instead of letting loglog mask them per draw
+            positive = (k > 0) & (P_k > 0)
+            if not positive.all():
+                k = k[positive]
+                P_k = P_k[positive]
+            # Rasterize the dense curves; axes, labels and legend stay vector
+            ax.loglog(k, P_k, label=label, linewidth=2, rasterized=True)
         
-        plt.xlabel(r'k [h/Mpc]', fontsize=14)
-        plt.ylabel(r'P(k) [(Mpc/h)³]', fontsize=14)
-        plt.title('Matter Power Spectrum', fontsize=16)
-        plt.legend(fontsize=12)
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
+        ax.set_xlabel(r'k [h/Mpc]', fontsize=14)
+        ax.set_ylabel(r'P(k) [(Mpc/h)³]', fontsize=14)
+        ax.set_title('Matter Power Spectrum', fontsize=16)
+        ax.legend(fontsize=12)
+        ax.grid(True, alpha=0.3)
         
         # Save the plot
         if os.path.isabs(output_filename):
@@ -233,8 +527,7 @@ class VisualizationAgent(BaseAgent):
         else:
             output_path = os.path.join(output_dir, output_filename)
         
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        fig.savefig(output_path, dpi=300, bbox_inches='tight')
         
         return output_path
     
@@ -256,33 +549,17 @@ class VisualizationAgent(BaseAgent):
             Message string
         """
         if redshift is not None:
-            return f"""Plot the power spectrum at redshift z={redshift} from the simulation output directory: {output_dir}
-
-Load the powerspectrum-{{scale_factor}}.txt files where scale_factor = 1/(1+z).
-Use matplotlib to create a loglog plot with:
-- X-axis: k [h/Mpc] 
-- Y-axis: P(k) [(Mpc/h)³]
-- Label the redshift on the plot
-- Save as {output_filename}
-
-Find the file with scale factor closest to {1.0/(1.0+redshift):.6f} for redshift {redshift}."""
+            return SINGLE_REDSHIFT_MESSAGE_TEMPLATE.format_map({
+                "redshift": redshift,
+                "scale_factor": f"{1.0 / (1.0 + redshift):.6f}",
+                "output_dir": output_dir,
+                "output_filename": output_filename
+            })
         else:
-            return f"""Plot all available power spectra from the simulation output directory: {output_dir}
-
-Load all powerspectrum-{{scale_factor}}.txt files and plot them together.
-For each file:
-1. Extract scale_factor from filename
-2. Calculate redshift = 1/scale_factor - 1
-3. Load the k and P(k) data
-4. Plot using matplotlib loglog scale
-
-Create a plot with:
-- X-axis: k [h/Mpc]
-- Y-axis: P(k) [(Mpc/h)³]  
-- Legend showing redshift for each curve
-- Save as {output_filename}
-
-Use different colors/styles for each redshift."""
+            return ALL_REDSHIFTS_MESSAGE_TEMPLATE.format_map({
+                "output_dir": output_dir,
+                "output_filename": output_filename
+            })
     
     def generate_and_execute_plot(self, output_dir: str, output_filename: str = "power_spectrum.png", redshift: Optional[float] = None) -> Any:
         """
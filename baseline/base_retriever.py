@@ -7,6 +7,9 @@ from datetime import datetime
 class ParameterRetriever(ABC):
     """Base class for parameter retrieval methods from scientific papers."""
     
+    REQUIRED_GENIC = frozenset({"OutputDir", "FileBase", "BoxSize", "Ngrid", "WhichSpectrum","FileWithInputSpectrum","Omega0","OmegaBaryon","OmegaLambda","HubbleParam","ProduceGas","Redshift","Seed"})
+    REQUIRED_GADGET = frozenset({"InitCondFile", "OutputDir", "OutputList", "TimeLimitCPU", "MetalReturnOn","CoolingOn","SnapshotWithFOF","BlackHoleOn","StarformationOn","WindOn","MassiveNuLinRespOn","DensityIndependentSphOn","Omega0"})
+    
     def __init__(self, model_name: str = "gpt-4o", api_key: str = None):
         self.model_name = model_name
         self.api_key = api_key
@@ -45,25 +48,19 @@ class ParameterRetriever(ABC):
         return formatted_content
     
     def validate_parameters(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate that parameters contain required fields."""
-        required_genic = ["OutputDir", "FileBase", "BoxSize", "Ngrid", "WhichSpectrum","FileWithInputSpectrum","Omega0","OmegaBaryon","OmegaLambda","HubbleParam","ProduceGas","Redshift","Seed"]
-        required_gadget = ["InitCondFile", "OutputDir", "OutputList", "TimeLimitCPU", "MetalReturnOn","CoolingOn","SnapshotWithFOF","BlackHoleOn","StarformationOn","WindOn","MassiveNuLinRespOn","DensityIndependentSphOn","Omega0"]
-        
+        """Validate that parameters contain required fields (returns a copy with an "errors" list)."""
         errors = []
         
-        if "genic" not in parameters:
+        genic = parameters.get("genic")
+        if genic is None:
             errors.append("Missing 'genic' section")
         else:
-            for field in required_genic:
-                if field not in parameters["genic"]:
-                    errors.append(f"Missing genic field: {field}")
+            errors.extend(f"Missing genic field: {field}" for field in sorted(self.REQUIRED_GENIC.difference(genic)))
         
-        if "gadget" not in parameters:
+        gadget = parameters.get("gadget")
+        if gadget is None:
             errors.append("Missing 'gadget' section")
         else:
-            for field in required_gadget:
-                if field not in parameters["gadget"]:
-                    errors.append(f"Missing gadget field: {field}")
+            errors.extend(f"Missing gadget field: {field}" for field in sorted(self.REQUIRED_GADGET.difference(gadget)))
         
-        parameters["errors"] = errors
-        return parameters
\ No newline at end of file
+        return {**parameters, "errors": errors}
\ No newline at end of file
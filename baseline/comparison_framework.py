@@ -1,20 +1,55 @@
 import os
 import json
 from datetime import datetime
+from pathlib import Path
 from typing import Dict, Any, List, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import time
 
 from .base_retriever import ParameterRetriever
 
 
+def _run_retriever(retriever: ParameterRetriever, paper_content: str,
+                   custom_prompt: str = None) -> Dict[str, Any]:
+    """Run a single retriever and measure performance (module level so worker processes can unpickle it)."""
+    
+    start_time = time.time()
+    
+    try:
+        parameters, reasoning = retriever.retrieve_parameters(paper_content, custom_prompt)
+        end_time = time.time()
+        
+        return {
+            "status": "success",
+            "parameters": parameters,
+            "reasoning": reasoning,
+            "execution_time": end_time - start_time,
+            "formatted_output": retriever.format_output(parameters, reasoning)
+        }
+    except Exception as e:
+        end_time = time.time()
+        return {
+            "status": "failed",
+            "error": str(e),
+            "execution_time": end_time - start_time
+        }
+
+
 class ParameterRetrievalComparison:
     """Framework for comparing different parameter retrieval methods."""
     
-    def __init__(self, output_dir: str = "./comparison_results"):
+    def __init__(self, output_dir: str = "./comparison_results", use_processes: bool = False):
+        """
+        Args:
+            output_dir: Directory for comparison results
+            use_processes: Run retrievers in worker processes instead of threads when
+                parallel, for CPU-bound retrievers (they must be picklable)
+        """
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
         self.results = []
+        self.use_processes = use_processes
+        self._created_dirs = set()
         
     def add_retriever(self, retriever: ParameterRetriever, name: str = None):
         """Add a retriever to the comparison."""
@@ -49,13 +84,26 @@ class ParameterRetrievalComparison:
         }
         
         if parallel:
-            # Run retrievers in parallel
-            with ThreadPoolExecutor(max_workers=len(self.retrievers)) as executor:
+            # Run retrievers in parallel (threads suit API-bound retrievers, processes
+            # sidestep the GIL for CPU-bound ones)
+            executor_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            
+            # Create every method directory up front so workers never race on makedirs
+            for name, _ in self.retrievers:
+                method_dir = os.path.join(paper_dir, name)
+                os.makedirs(method_dir, exist_ok=True)
+                self._created_dirs.add(method_dir)
+            
+            with executor_cls(max_workers=len(self.retrievers)) as executor:
                 future_to_retriever = {}
                 
                 for name, retriever in self.retrievers:
-                    future = executor.submit(self._run_single_retriever, 
-                                           retriever, paper_content, name, custom_prompt)
+                    if self.use_processes:
+                        future = executor.submit(_run_retriever, retriever, paper_content, custom_prompt)
+                    else:
+                        # Worker threads also write their own outputs, overlapping the disk I/O
+                        future = executor.submit(self._run_single_retriever, retriever, paper_content,
+                                                 name, custom_prompt, paper_dir)
                     future_to_retriever[future] = name
                 
                 for future in as_completed(future_to_retriever):
@@ -64,8 +112,9 @@ class ParameterRetrievalComparison:
                         result = future.result()
                         results["methods"][name] = result
                         
-                        # Save individual results
-                        self._save_retriever_output(paper_dir, name, result)
+                        # Save individual results (worker processes cannot reach self)
+                        if self.use_processes:
+                            self._save_retriever_output(paper_dir, name, result)
                         
                     except Exception as e:
                         results["methods"][name] = {
@@ -93,35 +142,21 @@ class ParameterRetrievalComparison:
         return results
     
     def _run_single_retriever(self, retriever: ParameterRetriever, 
-                            paper_content: str, name: str, custom_prompt: str = None) -> Dict[str, Any]:
-        """Run a single retriever and measure performance."""
-        
-        start_time = time.time()
-        
-        try:
-            parameters, reasoning = retriever.retrieve_parameters(paper_content, custom_prompt)
-            end_time = time.time()
-            
-            return {
-                "status": "success",
-                "parameters": parameters,
-                "reasoning": reasoning,
-                "execution_time": end_time - start_time,
-                "formatted_output": retriever.format_output(parameters, reasoning)
-            }
-        except Exception as e:
-            end_time = time.time()
-            return {
-                "status": "failed",
-                "error": str(e),
-                "execution_time": end_time - start_time
-            }
+                            paper_content: str, name: str, custom_prompt: str = None,
+                            paper_dir: str = None) -> Dict[str, Any]:
+        """Run a single retriever and measure performance, saving its output if paper_dir is given."""
+        result = _run_retriever(retriever, paper_content, custom_prompt)
+        if paper_dir is not None:
+            self._save_retriever_output(paper_dir, name, result)
+        return result
     
     def _save_retriever_output(self, paper_dir: str, method_name: str, result: Dict[str, Any]):
         """Save individual retriever output."""
         
         method_dir = os.path.join(paper_dir, method_name)
-        os.makedirs(method_dir, exist_ok=True)
+        if method_dir not in self._created_dirs:
+            os.makedirs(method_dir, exist_ok=True)
+            self._created_dirs.add(method_dir)
         
         if result["status"] == "success":
             # Save formatted output (similar to original save_message_to_files)
@@ -140,31 +175,21 @@ class ParameterRetrievalComparison:
             if "errors" not in result["parameters"] or len(result["parameters"]["errors"]) == 0:
                 self._create_config_files(method_dir, result["parameters"])
         
-        # Save full result
-        with open(os.path.join(method_dir, "full_result.json"), "w") as f:
+        # Save full result (compact; parameters.json is the human-readable copy)
+        with open(os.path.join(method_dir, "full_result.json"), "w", encoding="utf-8") as f:
             # Remove formatted_output from saved JSON to avoid duplication
-            result_copy = result.copy()
-            if "formatted_output" in result_copy:
-                del result_copy["formatted_output"]
-            json.dump(result_copy, f, indent=2)
+            result_copy = {key: value for key, value in result.items() if key != "formatted_output"}
+            json.dump(result_copy, f, separators=(',', ':'), ensure_ascii=False)
     
     def _create_config_files(self, output_dir: str, parameters: Dict[str, Any]):
         """Create .genic and .gadget configuration files."""
         
         # Create .genic file
         if "genic" in parameters:
-            genic_content = ""
-            for key, value in parameters["genic"].items():
-                genic_content += f"{key} = {value}\n"
-            
-            with open(os.path.join(output_dir, "sim.genic"), "w") as f:
-                f.write(genic_content)
+            genic_content = "".join(f"{key} = {value}\n" for key, value in parameters["genic"].items())
+            Path(output_dir, "sim.genic").write_text(genic_content)
         
         # Create .gadget file
         if "gadget" in parameters:
-            gadget_content = ""
-            for key, value in parameters["gadget"].items():
-                gadget_content += f"{key} = {value}\n"
-            
-            with open(os.path.join(output_dir, "sim.gadget"), "w") as f:
-                f.write(gadget_content)
\ No newline at end of file
+            gadget_content = "".join(f"{key} = {value}\n" for key, value in parameters["gadget"].items())
+            Path(output_dir, "sim.gadget").write_text(gadget_content)
\ No newline at end of file
@@ -1,10 +1,20 @@
 import os
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field, asdict
 from typing import Dict, Any, Optional
 from autogen import LLMConfig
 
 
-@dataclass
+# Settings are immutable; slots (Python 3.10+) drop the per-instance __dict__
+SETTINGS_DATACLASS_OPTIONS = {"frozen": True}
+if sys.version_info >= (3, 10):
+    SETTINGS_DATACLASS_OPTIONS["slots"] = True
+
+# Read once at import; the environment is only consulted again if it was unset then
+DEFAULT_API_KEY = os.environ.get("OPENAI_API_KEY")
+
+
+@dataclass(**SETTINGS_DATACLASS_OPTIONS)
 class LLMSettings:
     """LLM configuration settings."""
     api_type: str = "openai"
@@ -15,7 +25,7 @@ class LLMSettings:
     
     def to_llm_config(self) -> LLMConfig:
         """Convert to autogen LLMConfig."""
-        api_key = self.api_key or os.environ.get("OPENAI_API_KEY")
+        api_key = self.api_key or DEFAULT_API_KEY or os.environ.get("OPENAI_API_KEY")
         return LLMConfig(
             api_type=self.api_type,
             model=self.model,
@@ -25,7 +35,7 @@ class LLMSettings:
         )
 
 
-@dataclass
+@dataclass(**SETTINGS_DATACLASS_OPTIONS)
 class SLURMSettings:
     """SLURM configuration settings."""
     default_partition: str = "RM"
@@ -38,7 +48,7 @@ class SLURMSettings:
     mp_gadget_root: str = "/hildafs/projects/phy200018p/xzhangn/source/MP-Gadget"
 
 
-@dataclass
+@dataclass(**SETTINGS_DATACLASS_OPTIONS)
 class PathSettings:
     """File path settings."""
     camb_data_path: str = "/hildafs/home/xzhangn/xzhangn/LLM/5-multiagent/cmbagent_data/data/camb/"
@@ -47,7 +57,7 @@ class PathSettings:
     sr_code_path: str = "/hildafs/home/xzhangn/xzhangn/LLM/5-multiagent/sr_code/"
 
 
-@dataclass
+@dataclass(**SETTINGS_DATACLASS_OPTIONS)
 class AgentSettings:
     """Agent-specific settings."""
     executor_timeout: int = 120
@@ -55,24 +65,13 @@ class AgentSettings:
     density_field_vector_store_id: str = "vs_682cacef802c81919d54918a7d9c9b42"
 
 
-@dataclass
+@dataclass(**SETTINGS_DATACLASS_OPTIONS)
 class SimAgentConfig:
     """Main configuration class."""
-    llm: LLMSettings = None
-    slurm: SLURMSettings = None
-    paths: PathSettings = None
-    agents: AgentSettings = None
-    
-    def __post_init__(self):
-        """Initialize default values."""
-        if self.llm is None:
-            self.llm = LLMSettings()
-        if self.slurm is None:
-            self.slurm = SLURMSettings()
-        if self.paths is None:
-            self.paths = PathSettings()
-        if self.agents is None:
-            self.agents = AgentSettings()
+    llm: LLMSettings = field(default_factory=LLMSettings)
+    slurm: SLURMSettings = field(default_factory=SLURMSettings)
+    paths: PathSettings = field(default_factory=PathSettings)
+    agents: AgentSettings = field(default_factory=AgentSettings)
     
     @classmethod
     def from_dict(cls, config_dict: Dict[str, Any]) -> 'SimAgentConfig':
@@ -86,9 +85,4 @@ class SimAgentConfig:
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert config to dictionary."""
-        return {
-            'llm': self.llm.__dict__,
-            'slurm': self.slurm.__dict__,
-            'paths': self.paths.__dict__,
-            'agents': self.agents.__dict__
-        }
\ No newline at end of file
+        return asdict(self)
\ No newline at end of file
@@ -3,10 +3,117 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import colors
-from scipy.spatial import cKDTree as KDTree
+from matplotlib.collections import LineCollection
+try:
+    # pykdtree builds much faster than scipy for large point sets
+    from pykdtree.kdtree import KDTree
+    HAS_PYKDTREE = True
+except ImportError:
+    from scipy.spatial import cKDTree as KDTree
+    HAS_PYKDTREE = False
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+import os
 from gaepsi2 import camera, painter, color
 from bigfile import BigFile
 
+# Particles read per chunk in extract_particles (~48 MB of float32 positions)
+POSITION_CHUNK_SIZE = 1 << 22
+
+# Open Position columns by snapshot path, reused across extract_particles calls
+_position_columns = {}
+
+# Signs of the cube corners relative to the region center, in the order the
+# hidden corner is picked from below
+CORNER_SIGNS = np.array([
+    [-1, -1, -1], #0
+    [-1, -1, +1], #1
+    [-1, +1, -1], #2
+    [-1, +1, +1], #3
+    [+1, -1, -1], #4
+    [+1, -1, +1], #5
+    [+1, +1, -1], #6
+    [+1, +1, +1]  #7
+    ], dtype=np.float32)
+
+class MemmapColumn:
+    """
+    Read-only view of a BigFile column whose blocks are memory-mapped.
+    
+    BigFile stores a column as raw binary block files (000000, 000001, ...)
+    described by a plain-text header, so the blocks can be mapped directly and
+    re-reads are served from the OS page cache. Supports `size`, `dtype` and
+    slicing by row, like a bigfile Column.
+    """
+    def __init__(self, column_dir):
+        header = {}
+        with open(os.path.join(column_dir, "header")) as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                header[key.strip()] = value.strip()
+        
+        self.dtype = np.dtype(header["DTYPE"])
+        nmemb = int(header["NMEMB"])
+        self.blocks = []
+        for i in range(int(header["NFILE"])):
+            name = "%06X" % i
+            nrows = int(header[name].split(":")[0])
+            if nrows == 0:
+                continue
+            block = np.memmap(os.path.join(column_dir, name), dtype=self.dtype, mode="r",
+                              shape=(nrows, nmemb))
+            self.blocks.append(block)
+        self.offsets = np.cumsum([0] + [len(block) for block in self.blocks])
+        self.size = int(self.offsets[-1])
+    
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(self.size)
+        pieces = []
+        for block, offset in zip(self.blocks, self.offsets):
+            lo, hi = max(start - offset, 0), min(stop - offset, len(block))
+            if lo < hi:
+                pieces.append(block[lo:hi])
+        if len(pieces) == 1:
+            return pieces[0]
+        if not pieces:
+            return np.empty((0,) + self.blocks[0].shape[1:], dtype=self.dtype)
+        return np.concatenate(pieces)
+
+
+def open_position_column(path):
+    """
+    Open the Position column of a snapshot, memory-mapped if possible.
+    
+    Falls back to bigfile when the blocks cannot be mapped (e.g. a missing or
+    unexpected header).
+    """
+    try:
+        return MemmapColumn(os.path.join(path, "Position"))
+    except (OSError, KeyError, ValueError, TypeError) as e:
+        print(f"Could not memory-map Position in {path} ({e}), reading with bigfile")
+        return BigFile(path).open("Position")
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _wrap_and_mask(ppos, center, boxsize, half_region, out_mask):
+        """
+        Center, periodically wrap and select positions in a single fused pass.
+        
+        ppos is updated in place; out_mask[i] is set if particle i lies inside
+        the cuboid of half-widths half_region.
+        """
+        for i in prange(ppos.shape[0]):
+            inside = True
+            for j in range(3):
+                dx = ppos[i, j] - center[j]
+                dx -= boxsize * round(dx / boxsize)
+                ppos[i, j] = dx
+                inside &= abs(dx) < half_region[j]
+            out_mask[i] = inside
+
 # %%
 def extract_particles(path, config):
     """
@@ -35,28 +142,79 @@ def extract_particles(path, config):
     Notes
     -----
     Position wrapping is applied to handle periodic boundary conditions when
-    the region crosses the simulation box boundary.
+    the region crosses the simulation box boundary. Positions are streamed in
+    chunks of POSITION_CHUNK_SIZE particles, so only the selected particles
+    are ever held in memory in full.
     """
-    # Load particle positions
-    part = BigFile(path)
-    ppos = np.float32(part.open("Position")[:])
+    # Open the particle positions once per snapshot
+    col = _position_columns.get(path)
+    if col is None:
+        col = open_position_column(path)
+        _position_columns[path] = col
+    
+    center = np.broadcast_to(np.asarray(config["view_center"], dtype=np.float32), (3,)).copy()
+    boxsize = np.float32(config["simulation_box_size"])
+    half_region = np.array([config["region_x"], config["region_y"], config["region_z"]], dtype=np.float32) * 0.5
     
-    # Center positions around the target region
-    ppos -= config["view_center"]
-    boxsize = config["simulation_box_size"]
+    # A region covering the whole box keeps every (wrapped) particle, so no mask is needed
+    full_box = bool(np.all(half_region * 2 >= boxsize))
     
-    # Apply periodic boundary conditions
-    ppos[ppos < -boxsize / 2] += boxsize
-    ppos[ppos > boxsize / 2] -= boxsize
-
-    # Create mask for particles inside the cuboid
-    mask = np.abs(ppos[:, 0]) < config["region_x"] * 0.5 
-    mask &= np.abs(ppos[:, 1]) < config["region_y"] * 0.5
-    mask &= np.abs(ppos[:, 2]) < config["region_z"] * 0.5
+    # Scratch buffer for the numpy path, allocated once and reused by every chunk
+    tmp = None
+    if not HAS_NUMBA:
+        tmp = np.empty((min(POSITION_CHUNK_SIZE, col.size), 3), dtype=np.float32)
+    
+    masks = []
+    selected = []
+    for start in range(0, col.size, POSITION_CHUNK_SIZE):
+        # Load a chunk of positions (no extra cast if already stored as float32);
+        # mapped float32 blocks are read-only, so those chunks are copied once
+        ppos = col[start:start + POSITION_CHUNK_SIZE].astype(np.float32, copy=False)
+        if not ppos.flags.writeable:
+            ppos = np.array(ppos)
+        
+        if HAS_NUMBA:
+            # One fused parallel pass, no temporaries
+            mask = np.empty(ppos.shape[0], dtype=bool)
+            _wrap_and_mask(ppos, center, boxsize, half_region, mask)
+            if full_box:
+                selected.append(ppos)
+                continue
+            masks.append(mask)
+            selected.append(ppos[mask])
+            continue
+        
+        # Center positions around the target region, in place
+        ppos -= center
+        
+        # Apply periodic boundary conditions in one branchless pass,
+        # ppos -= boxsize * rint(ppos / boxsize), entirely in preallocated buffers
+        buf = tmp[:ppos.shape[0]]
+        np.divide(ppos, boxsize, out=buf)
+        np.rint(buf, out=buf)
+        np.multiply(buf, boxsize, out=buf)
+        np.subtract(ppos, buf, out=ppos)
+        
+        if full_box:
+            selected.append(ppos)
+            continue
+        
+        # Create mask for particles inside the cuboid (the scratch buffer holds |ppos|)
+        np.abs(ppos, out=buf)
+        mask = buf[:, 0] < half_region[0]
+        mask &= buf[:, 1] < half_region[1]
+        mask &= buf[:, 2] < half_region[2]
+        
+        # Filter positions using the mask
+        masks.append(mask)
+        selected.append(ppos[mask])
     
-    # Filter positions using the mask
-    ppos_ = ppos[mask]
-    print(f"Selected {ppos_.shape[0]} particles from {ppos.shape[0]} ({ppos_.shape[0]/ppos.shape[0]*100:.2f}%)")
+    if full_box:
+        mask = np.ones(col.size, dtype=bool)
+    else:
+        mask = np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+    ppos_ = np.concatenate(selected) if selected else np.zeros((0, 3), dtype=np.float32)
+    print(f"Selected {ppos_.shape[0]} particles from {mask.shape[0]} ({ppos_.shape[0]/max(mask.shape[0], 1)*100:.2f}%)")
     
     return mask, ppos_
 
@@ -86,14 +244,29 @@ def smooth(pos, k=60):
     For large-scale structure, use larger k values (50+).
     """
     # Build KD-tree for efficient nearest neighbor queries
-    tree = KDTree(pos)
+    if HAS_PYKDTREE:
+        # pykdtree needs contiguous data, with queries of the same dtype
+        pos = np.ascontiguousarray(pos, dtype=np.float32)
+        tree = KDTree(pos, leafsize=16)
+        
+        # Query the k nearest neighbors for each particle (squared distances
+        # skip a sqrt over all N*k entries)
+        # pykdtree always returns all k columns: free the indices right away
+        d, i = tree.query(pos, k=k, sqr_dists=True)
+        del i
+        
+        # Return the distance to the kth neighbor as the smoothing length
+        # (d is 1-D when k == 1)
+        return np.sqrt(d.reshape(len(pos), -1)[:, -1]).astype(np.float32, copy=False)
+    
+    tree = KDTree(pos, leafsize=32)
     
-    # Query the k nearest neighbors for each particle
-    # Returns distances (d) and indices (i)
-    d, i = tree.query(pos, k=k)
+    # Query only the kth nearest neighbor for each particle on all cores;
+    # k=[k] returns an (N, 1) result instead of the full N x k matrices
+    d, _ = tree.query(pos, k=[k], workers=-1)
     
     # Return the distance to the kth neighbor as the smoothing length
-    return d[:, -1].copy()
+    return d[:, 0].astype(np.float32, copy=False)
 
 # %%
 visualization_config = {
@@ -110,12 +283,15 @@ visualization_config = {
 # %%
 path = "/hildafs/home/xzhangn/xzhangn/sim_output/dmo-100MPC/test-data/7_0/dmo-512/set3/output/PART_099/1"
 mask, pos = extract_particles(path, visualization_config)
-print("pos x range: ", np.min(pos[:, 0]), np.max(pos[:, 0]))
-print("pos y range: ", np.min(pos[:, 1]), np.max(pos[:, 1]))
-print("pos z range: ", np.min(pos[:, 2]), np.max(pos[:, 2]))
+if __debug__ and len(pos):
+    # Two axis-wise reductions instead of six strided column passes (skipped under python -O)
+    pos_min, pos_max = pos.min(axis=0), pos.max(axis=0)
+    print("pos x range: ", pos_min[0], pos_max[0])
+    print("pos y range: ", pos_min[1], pos_max[1])
+    print("pos z range: ", pos_min[2], pos_max[2])
 k = None
 if k is None:
-    sml = np.ones(len(pos)) * visualization_config['particle_smoothing'] # constant smoothing length
+    sml = np.full(len(pos), visualization_config['particle_smoothing'], dtype=np.float32) # constant smoothing length
 else:
     sml = smooth(pos, k=k) # calculate smoothing length based on number of nearby particles
 
@@ -126,7 +302,7 @@ r_xy = 1.5
 z_scale = 0.2
 volume_scale = 1.5
 imsize = visualization_config["imsize"]
-weight = np.ones(len(pos)) * visualization_config["particle_weight"]
+weight = np.full(len(pos), visualization_config["particle_weight"], dtype=np.float32)
 
 # %%
 def calc_matrix(config, theta, r_xy, z_scale, volume_scale):
@@ -181,29 +357,55 @@ def calc_matrix(config, theta, r_xy, z_scale, volume_scale):
     return mat
 
 
+def apply_affine(mat, pos):
+    """
+    Apply an affine camera matrix to positions without homogeneous coordinates.
+    
+    Equivalent to camera.apply for orthographic views, whose matrix has no
+    perspective row, so the (N, 4) padding and the division by w are skipped.
+    
+    mat: ndarray, shape (4, 4)
+        Camera matrix from calc_matrix
+    pos: ndarray, shape (N, 3)
+        Positions to transform
+    """
+    # Cast the matrix to the positions' dtype so float32 input stays float32
+    mat = np.asarray(mat, dtype=pos.dtype)
+    return pos @ mat[:3, :3].T + mat[:3, 3]
+
+
 # %%
 matrix = calc_matrix(visualization_config, theta=theta, r_xy=r_xy, z_scale=z_scale, volume_scale=volume_scale)
 dm2d = camera.apply(matrix, pos)
 dmdev = camera.todevice(dm2d, extent=(imsize, imsize))
-channels = painter.paint(dmdev, sml, [weight], (imsize, imsize), np=16)
+
+# Paint with one thread per core, with particles sorted by image tile so each
+# thread scatters into a compact region of the image
+nthreads = int(os.environ.get("GAEPSI_PAINT_THREADS", os.cpu_count() or 16))
+tx = (dmdev[:, 0] * nthreads // imsize).astype(np.int32)
+ty = (dmdev[:, 1] * nthreads // imsize).astype(np.int32)
+order = np.lexsort((tx, ty))
+del tx, ty
+# Constant smoothing lengths and weights are the same in any order, so only
+# per-particle values are permuted (saves an N-sized copy each)
+dmdev = dmdev[order]
+if k is not None:
+    sml = sml[order]
+channels = painter.paint(dmdev, sml, [weight], (imsize, imsize), np=nthreads)
 img = channels[0].T
 
+# The image is only displayed through LogNorm, so keep it in half precision when
+# its range fits (gaepsi2 itself accumulates in float32)
+if np.max(img) < np.finfo(np.float16).max:
+    img = img.astype(np.float16)
+
 # %%
 half_region_x = visualization_config["region_x"] / 2
 half_region_y = visualization_config["region_y"] / 2
 half_region_z = visualization_config["region_z"] / 2
 
-corner = np.array([
-    [-half_region_x,-half_region_y,-half_region_z], #0
-    [-half_region_x,-half_region_y,+half_region_z], #1
-    [-half_region_x,+half_region_y,-half_region_z], #2
-    [-half_region_x,+half_region_y,+half_region_z], #3
-    [+half_region_x,-half_region_y,-half_region_z], #4
-    [+half_region_x,-half_region_y,+half_region_z], #5
-    [+half_region_x,+half_region_y,-half_region_z], #6
-    [+half_region_x,+half_region_y,+half_region_z]  #7
-    ])
-corner2d = camera.apply(matrix, corner)
+corner = CORNER_SIGNS * np.array([half_region_x, half_region_y, half_region_z], dtype=np.float32)
+corner2d = apply_affine(matrix, corner)
 cornerdev = camera.todevice(corner2d, extent=(imsize, imsize))
 
 if (0 <= theta < np.pi / 2):
@@ -215,45 +417,64 @@ elif (np.pi <= theta < 1.5 * np.pi):
 elif (1.5 * np.pi <= theta < 2 * np.pi):
     dash_corner = cornerdev[2]
     
-cn2d = []
-for i in range(0, len(cornerdev)):
-    p = cornerdev[i]
-    dr = corner - corner[i]
-    # Find adjacent corners (differ by exactly one coordinate)
-    msk = np.count_nonzero(dr, axis=-1) == 1
-    for o in cornerdev[msk]:
-        x, y = np.array([p[0], o[0]]), np.array([p[1], o[1]])
-        r2 = np.linalg.norm(o - dash_corner, axis=0)
-        r3 = np.linalg.norm(p - dash_corner, axis=0)
-        # Determine line style based on visibility
-        if (r2 < 1 or r3 < 1):
-            cn2d.append([x, y, 0])  # Dashed line
-        else:
-            cn2d.append([x, y, 1])  # Solid line
+# Find adjacent corners (differ by exactly one coordinate): 24 directed edges
+edges = np.argwhere(np.count_nonzero(corner[:, None, :] - corner[None, :, :], axis=-1) == 1)
+p = cornerdev[edges[:, 0]]
+o = cornerdev[edges[:, 1]]
+
+# Determine line style based on visibility: edges touching the hidden corner are
+# dashed (0), all others solid (1)
+r_dash = np.linalg.norm(cornerdev - dash_corner, axis=1)
+style = ((r_dash[edges[:, 0]] >= 1) & (r_dash[edges[:, 1]] >= 1)).astype(int)
+
+# Segments as [[x0, y0], [x1, y1]] rows, split by style for one collection each
+segments = np.stack([p, o], axis=1)[:, :, :2]
+dash_segs = segments[style == 0]
+solid_segs = segments[style == 1]
 
 # %%
+def fast_percentile(values, q, max_samples=4096 * 4096 // 10):
+    """
+    Percentile by selection (np.partition, O(N)) instead of a full sort.
+    
+    Matches np.percentile's linear interpolation. Arrays with more than
+    max_samples entries are estimated from a fixed-seed random subsample.
+    
+    values: ndarray
+        Values to take the percentile of (flattened)
+    q: float
+        Percentile in [0, 100]
+    max_samples: int
+        Largest number of values used exactly
+    """
+    flat = np.ravel(values)
+    if flat.size > max_samples:
+        flat = flat[np.random.default_rng(0).integers(0, flat.size, max_samples)]
+    pos = q / 100 * (flat.size - 1)
+    lo = int(np.floor(pos))
+    hi = min(lo + 1, flat.size - 1)
+    part = np.partition(flat, [lo, hi])
+    return part[lo] + (part[hi] - part[lo]) * (pos - lo)
+
 figsize = (11 , 11)
 plt.style.use('dark_background')
 fig, ax = plt.subplots(1, 1, figsize=figsize)
 ax.axis('off')
-vmax = np.percentile(img, 99.99)
+vmax = float(fast_percentile(img, 99.99))
 vmin = vmax / 1000
 print("vmax: ", vmax)
 print("vmin: ", vmin)
 
-ax.imshow(img,
+ax.imshow(img.astype(np.float32, copy=False),
           norm=colors.LogNorm(vmin=vmin, vmax=vmax), 
           cmap='inferno',
           extent=[0, imsize, 0, imsize],
           origin='lower',
           )
-# plot the corner
-for d in cn2d:
-    x, y, style = d
-    if style == 0:
-        ax.plot(x, y, c='grey', alpha=0.5, lw=2, linestyle='--')
-    else:
-        ax.plot(x, y, c='white', lw=1.5, alpha=0.7)
+# plot the corner: one collection per line style instead of a Line2D per edge
+ax.add_collection(LineCollection(dash_segs, colors='grey', alpha=0.5, linewidths=2, linestyles='--'))
+ax.add_collection(LineCollection(solid_segs, colors='white', linewidths=1.5, alpha=0.7))
+ax.autoscale_view()
 plt.show()
 
 # %%
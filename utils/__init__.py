@@ -1,7 +1,10 @@
-from .file_utils import save_message_to_files
+from .file_utils import save_message_to_files, list_part_dirs
 from .slurm_utils import submit_slurm_job
+from .semantic_cache import SemanticCache
 
 __all__ = [
     'save_message_to_files',
-    'submit_slurm_job'
+    'list_part_dirs',
+    'submit_slurm_job',
+    'SemanticCache'
 ]
\ No newline at end of file
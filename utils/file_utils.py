@@ -1,6 +1,7 @@
 import json
 import os
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple
 
 
 def save_message_to_files(
@@ -13,7 +14,7 @@ def save_message_to_files(
     Args:
         message: JSON message containing simulation parameters
         base_path: Base directory path for output
-        
+    
     Returns:
         Dictionary with paths to created files
     """
@@ -33,54 +34,80 @@ def save_message_to_files(
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    # Values replaced by local paths, keyed by parameter name
+    genic_overrides = {
+        "OutputDir": lambda value: output_dir,
+        "FileWithInputSpectrum": lambda value: base_path + value,
+        "FileBase": lambda value: file_base,
+        "FileWithTransferFunction": lambda value: file_with_transfer_function,
+    }
+    gadget_overrides = {
+        "InitCondFile": lambda value: f"{output_dir}{file_base}",
+        "OutputDir": lambda value: output_dir,
+    }
+    
+    # Build each file in memory and write it with a single call
     # Save .genic file
     genic_path = f"{base_path}output.genic"
+    genic_content = "".join(
+        f"{key} = {genic_overrides[key](value) if key in genic_overrides else value}\n"
+        for key, value in data['genic'].items()
+    )
+    genic_content += f"FileWithTransferFunction = {file_with_transfer_function}\n"
     with open(genic_path, 'w') as f:
-        for key, value in data['genic'].items():
-            if key == "OutputDir":
-                f.write(f"{key} = {output_dir}\n")
-            elif key == "FileWithInputSpectrum":
-                file_with_input_spectrum = base_path + value
-                f.write(f"{key} = {file_with_input_spectrum}\n")
-            elif key == "FileBase":
-                f.write(f"{key} = {file_base}\n")
-            elif key == "FileWithTransferFunction":
-                f.write(f"{key} = {file_with_transfer_function}\n")
-            else:
-                f.write(f"{key} = {value}\n")
-        f.write("FileWithTransferFunction = " + file_with_transfer_function + "\n")
+        f.write(genic_content)
     
     # Save .gadget file
     gadget_path = f"{base_path}output.gadget"
+    gadget_content = "".join(
+        f"{key} = {gadget_overrides[key](value) if key in gadget_overrides else value}\n"
+        for key, value in data['gadget'].items()
+    )
     with open(gadget_path, 'w') as f:
-        for key, value in data['gadget'].items():
-            if key == "InitCondFile":
-                f.write(f"{key} = {output_dir}{file_base}\n")
-            elif key == "OutputDir":
-                f.write(f"{key} = {output_dir}\n")
-            else:
-                f.write(f"{key} = {value}\n")
+        f.write(gadget_content)
     
     # Save error messages
     error_path = f"{base_path}error_messages.txt"
+    error_lines = ["Error Messages:\n", "==============\n\n"]
+    error_lines.extend(f"- {error}\n" for error in data.get('errors', []))
+    
+    # Add the reasoning part if present
+    if "**Parameter Extraction Reasoning:**" in message:
+        error_lines.append("\nParameter Extraction Reasoning:\n")
+        error_lines.append("============================\n\n")
+        reasoning = message.split("**Parameter Extraction Reasoning:**")[1].strip()
+        error_lines.extend(f"{line.strip()}\n" for line in reasoning.split('\n') if line.strip())
+    
     with open(error_path, 'w') as f:
-        f.write("Error Messages:\n")
-        f.write("==============\n\n")
-        for error in data.get('errors', []):
-            f.write(f"- {error}\n")
-        
-        # Add the reasoning part if present
-        if "**Parameter Extraction Reasoning:**" in message:
-            f.write("\nParameter Extraction Reasoning:\n")
-            f.write("============================\n\n")
-            reasoning = message.split("**Parameter Extraction Reasoning:**")[1].strip()
-            for line in reasoning.split('\n'):
-                if line.strip():
-                    f.write(f"{line.strip()}\n")
+        f.write("".join(error_lines))
     
     return {
         "genic_path": genic_path,
         "gadget_path": gadget_path,
         "error_path": error_path,
         "output_dir": output_dir
-    }
\ No newline at end of file
+    }
+
+
+@lru_cache(maxsize=32)
+def _list_part_dirs(root: str, mtime_ns: int) -> Tuple[str, ...]:
+    """Scan root for PART_* directories; mtime_ns keys the cache to the directory's contents."""
+    with os.scandir(root) as entries:
+        return tuple(sorted(entry.name for entry in entries if entry.name.startswith("PART_") and entry.is_dir()))
+
+
+def list_part_dirs(root: str) -> List[str]:
+    """
+    List the PART_* snapshot directories of a simulation output directory.
+    
+    The scan is memoized on the directory's path and mtime, so repeated calls
+    only re-read the directory after snapshots are added or removed.
+    
+    Args:
+        root: Simulation output directory
+    
+    Returns:
+        Sorted snapshot directory names (e.g. ["PART_000", "PART_001"])
+    """
+    root = os.path.abspath(str(root))
+    return list(_list_part_dirs(root, os.stat(root).st_mtime_ns))
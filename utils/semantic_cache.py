@@ -0,0 +1,131 @@
+"""
+Semantic cache of parameter extractions, keyed by the paper's content hash and
+an embedding of the custom prompt, so repeated or paraphrased prompts on the
+same paper can skip the LLM round trips entirely.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from agents.vector_store_cache import load_index, update_index
+
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+
+def normalize_prompt(prompt: Optional[str]) -> str:
+    """Collapse a prompt's whitespace, so reflowed prompts still hit exactly (case is kept)."""
+    return " ".join((prompt or "").split())
+
+
+class SemanticCache:
+    """
+    On-disk cache of (paper, prompt) -> extraction result.
+    
+    Exact matches on the normalized prompt always hit. If sentence-transformers
+    is installed, prompts whose embeddings have cosine similarity above the
+    threshold hit as well; otherwise only exact matches are served.
+    """
+    
+    def __init__(
+        self,
+        cache_dir: str,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        model_name: str = SEMANTIC_CACHE_MODEL
+    ):
+        """
+        Initialize the cache.
+        
+        Args:
+            cache_dir: Directory holding the cache index
+            threshold: Minimum cosine similarity for a semantic hit
+            model_name: sentence-transformers model used to embed prompts
+        """
+        self.index_path = os.path.join(str(cache_dir), "semantic_cache.json")
+        self.threshold = threshold
+        self.model_name = model_name
+        self._model = None
+    
+    def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        """Embed a prompt as a unit vector, or return None if no model is available."""
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            except ImportError:
+                logger.info("sentence-transformers not installed; semantic cache limited to exact prompt matches")
+                self._model = False
+        if self._model is False:
+            return None
+        return np.asarray(self._model.encode(prompt, normalize_embeddings=True), dtype=np.float32)
+    
+    @staticmethod
+    def _entry_key(paper_hash: str, prompt: str) -> str:
+        """Index key for a paper hash and normalized prompt."""
+        return f"{paper_hash}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+    
+    def lookup(self, paper_hash: str, prompt: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached result for a paper and prompt.
+        
+        Args:
+            paper_hash: SHA-256 of the paper file
+            prompt: Custom prompt used for the extraction
+        
+        Returns:
+            Cached result, or None on a miss
+        """
+        entries = load_index(self.index_path)
+        normalized = normalize_prompt(prompt)
+        
+        entry = entries.get(self._entry_key(paper_hash, normalized))
+        if entry is not None:
+            return entry["result"]
+        
+        candidates = [
+            entry for key, entry in entries.items()
+            if key.startswith(paper_hash + ":") and entry.get("embedding")
+        ]
+        if not candidates:
+            return None
+        
+        query = self._embed(normalized)
+        if query is None:
+            return None
+        
+        embeddings = np.asarray([entry["embedding"] for entry in candidates], dtype=np.float32)
+        similarities = embeddings @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] > self.threshold:
+            logger.info("♻️ Semantic cache hit (similarity %.3f) for prompt: %s", similarities[best], candidates[best]['prompt'])
+            return candidates[best]["result"]
+        return None
+    
+    def store(self, paper_hash: str, prompt: Optional[str], result: Dict[str, Any]) -> None:
+        """
+        Record the result of an extraction.
+        
+        Args:
+            paper_hash: SHA-256 of the paper file
+            prompt: Custom prompt used for the extraction
+            result: Extraction result (must be JSON-serializable)
+        """
+        normalized = normalize_prompt(prompt)
+        embedding = self._embed(normalized)
+        entry: Dict[str, Any] = {
+            "prompt": prompt or "",
+            "embedding": embedding.astype(np.float16).tolist() if embedding is not None else None,
+            "result": result
+        }
+        try:
+            update_index(self.index_path, {self._entry_key(paper_hash, normalized): entry})
+        except OSError as e:
+            logger.warning("Could not write semantic cache %s: %s", self.index_path, e)
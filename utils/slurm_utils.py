@@ -1,7 +1,41 @@
+import string
 import subprocess
+from pathlib import Path
 from typing import Optional
 
 
+# Parsed once at import; $$ escapes the shell variables of the batch script
+SLURM_SCRIPT_TEMPLATE = string.Template("""#!/bin/bash
+#SBATCH --partition=${partition}
+#SBATCH --output=${working_dir}run.out
+#SBATCH --job-name=${job_name}
+#SBATCH --time=${time}
+#SBATCH -N ${nodes}
+#SBATCH --ntasks=${ntasks}
+#SBATCH --cpus-per-task=${cpus_per_task}
+#SBATCH --mail-type=END
+#SBATCH --mail-user=${email}
+#SBATCH --mem-per-cpu=${mem_per_cpu}
+
+module load intel/2022.1.2
+module load intelmpi/2022.1.2-intel2022.1.2 
+
+export OMP_NUM_THREADS=${cpus_per_task}
+export I_MPI_JOB_RESPECT_PROCESS_PLACEMENT=0
+
+ROOT=${mp_gadget_root}
+SCRIPT_ROOT_DIR=${working_dir}
+
+echo "Generating IC for set $$k"
+date
+mpirun -np ${ntasks} $$ROOT/genic/MP-GenIC $$SCRIPT_ROOT_DIR/output.genic || exit 1
+echo "Running Gadget for set $$k"
+date
+mpirun -np ${ntasks} $$ROOT/gadget/MP-Gadget $$SCRIPT_ROOT_DIR/output.gadget || exit 1
+echo "Finished set $$k"
+date""")
+
+
 def submit_slurm_job(
     working_dir: str,
     nodes: int = 1,
@@ -35,51 +69,35 @@ def submit_slurm_job(
     if not working_dir.endswith("/"):
         working_dir += "/"
     
-    template_script = f"""#!/bin/bash
-#SBATCH --partition={partition}
-#SBATCH --output={working_dir}run.out
-#SBATCH --job-name={job_name}
-#SBATCH --time={time}
-#SBATCH -N {nodes}
-#SBATCH --ntasks={ntasks}
-#SBATCH --cpus-per-task={cpus_per_task}
-#SBATCH --mail-type=END
-#SBATCH --mail-user={email}
-#SBATCH --mem-per-cpu={mem_per_cpu}
-
-module load intel/2022.1.2
-module load intelmpi/2022.1.2-intel2022.1.2 
-
-export OMP_NUM_THREADS={cpus_per_task}
-export I_MPI_JOB_RESPECT_PROCESS_PLACEMENT=0
-
-ROOT={mp_gadget_root}
-SCRIPT_ROOT_DIR={working_dir}
-
-echo "Generating IC for set $k"
-date
-mpirun -np {ntasks} $ROOT/genic/MP-GenIC $SCRIPT_ROOT_DIR/output.genic || exit 1
-echo "Running Gadget for set $k"
-date
-mpirun -np {ntasks} $ROOT/gadget/MP-Gadget $SCRIPT_ROOT_DIR/output.gadget || exit 1
-echo "Finished set $k"
-date"""
+    template_script = SLURM_SCRIPT_TEMPLATE.substitute(
+        partition=partition,
+        working_dir=working_dir,
+        job_name=job_name,
+        time=time,
+        nodes=nodes,
+        ntasks=ntasks,
+        cpus_per_task=cpus_per_task,
+        email=email,
+        mem_per_cpu=mem_per_cpu,
+        mp_gadget_root=mp_gadget_root,
+    )
     
-    # Save the script
-    script_path = working_dir + "script.slurm"
-    with open(script_path, "w") as f:
-        f.write(template_script)
+    # Save the script atomically so sbatch never reads a partially written file
+    script_path = Path(working_dir) / "script.slurm"
+    tmp_path = script_path.with_suffix(".slurm.tmp")
+    tmp_path.write_text(template_script)
+    tmp_path.replace(script_path)
     
     # Submit the job
     try:
         result = subprocess.run(
-            ["sbatch", script_path],
+            ["sbatch", "--parsable", str(script_path)],
             capture_output=True,
             text=True
         )
         if result.returncode == 0:
-            # Extract job ID from output
-            job_id = result.stdout.strip().split()[-1]
+            # --parsable prints "jobid" or "jobid;cluster"
+            job_id = result.stdout.strip().split(";")[0]
             return job_id
         else:
             print(f"SLURM submission failed: {result.stderr}")
@@ -10,14 +10,24 @@ load_dotenv()
 sys.path.append(str(Path(__file__).parent.parent))
 
 def read_pdf_content(pdf_path):
-    """Read content from PDF file."""
+    """Read content from PDF file, reusing the text cached in <pdf_path>.txt while it is current."""
+    cache_path = Path(str(pdf_path) + ".txt")
+    try:
+        if cache_path.stat().st_mtime >= Path(pdf_path).stat().st_mtime:
+            return cache_path.read_text(encoding='utf-8')
+    except OSError:
+        pass
+    
     try:
         import PyPDF2
         with open(pdf_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            content = ""
-            for page in pdf_reader.pages:
-                content += page.extract_text() + "\n"
+            content = "".join(page.extract_text() + "\n" for page in pdf_reader.pages)
+        
+        try:
+            cache_path.write_text(content, encoding='utf-8')
+        except OSError as e:
+            print(f"Warning: Could not cache PDF text to {cache_path}: {e}")
         return content
     except ImportError:
         print("PyPDF2 not installed. Install with: pip install PyPDF2")
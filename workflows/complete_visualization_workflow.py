@@ -4,9 +4,12 @@ Complete visualization workflow that runs both visualization and density field a
 First creates power spectrum plots, then generates 3D density field visualizations.
 """
 
+import atexit
 import sys
 import os
+from functools import lru_cache
 from pathlib import Path
+from typing import List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -17,6 +20,30 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from agents.visualization_agent import VisualizationAgent
 from agents.density_field_agent import DensityFieldAgent
+from utils.file_utils import list_part_dirs
+
+
+@lru_cache(maxsize=4)
+def _get_visualization_agent() -> VisualizationAgent:
+    """Create the visualization agent once and reuse it across workflow runs."""
+    return VisualizationAgent()
+
+
+@lru_cache(maxsize=4)
+def _get_density_agent(demo_path: str) -> DensityFieldAgent:
+    """Create the density field agent once per demo file, so its RAG store is embedded only once."""
+    return DensityFieldAgent(gaepsi2_demo_path=demo_path)
+
+
+def _cleanup_agents() -> None:
+    """Release the cached density field agents' vector stores at interpreter exit."""
+    for demo_path in _density_agent_paths:
+        _get_density_agent(demo_path).cleanup()
+
+
+# Demo paths with a cached density field agent, for the exit-time cleanup
+_density_agent_paths = set()
+atexit.register(_cleanup_agents)
 
 
 def run_visualization_workflow(simulation_output_dir: Path, visualization_output_dir: Path) -> bool:
@@ -36,7 +63,7 @@ def run_visualization_workflow(simulation_output_dir: Path, visualization_output
     try:
         # Create visualization agent
         print("🤖 Creating VisualizationAgent...")
-        viz_agent = VisualizationAgent()
+        viz_agent = _get_visualization_agent()
         
         # Generate and execute power spectrum plot
         print("🚀 Generating power spectrum plot...")
@@ -63,7 +90,12 @@ def run_visualization_workflow(simulation_output_dir: Path, visualization_output
         return False
 
 
-def run_density_field_workflow(simulation_output_dir: Path, visualization_output_dir: Path, demo_file: Path) -> bool:
+def run_density_field_workflow(
+    simulation_output_dir: Path,
+    visualization_output_dir: Path,
+    demo_file: Path,
+    snapshot_names: Optional[List[str]] = None
+) -> bool:
     """
     Run the density field workflow to create 3D visualizations.
     
@@ -71,6 +103,8 @@ def run_density_field_workflow(simulation_output_dir: Path, visualization_output
         simulation_output_dir: Directory containing simulation output
         visualization_output_dir: Directory to save visualization output
         demo_file: Path to gaepsi2 demo file
+        snapshot_names: Snapshots to visualize (e.g. a time series); if None, only the
+            first available PART directory is processed
         
     Returns:
         True if successful, False otherwise
@@ -85,7 +119,7 @@ def run_density_field_workflow(simulation_output_dir: Path, visualization_output
         return False
     
     # List available PART directories
-    part_dirs = list(simulation_output_dir.glob("PART_*"))
+    part_dirs = list_part_dirs(simulation_output_dir)
     if not part_dirs:
         print(f"❌ Error: No PART_* directories found in {simulation_output_dir}")
         return False
@@ -95,12 +129,31 @@ def run_density_field_workflow(simulation_output_dir: Path, visualization_output
     try:
         # Create density field agent with RAG
         print("🤖 Creating DensityFieldAgent with RAG...")
-        density_agent = DensityFieldAgent(
-            gaepsi2_demo_path=str(demo_file)
-        )
+        density_agent = _get_density_agent(str(demo_file))
+        _density_agent_paths.add(str(demo_file))
+        
+        # Several snapshots share one assistant run and one execution pool
+        if snapshot_names and len(snapshot_names) > 1:
+            print(f"🎯 Processing {len(snapshot_names)} snapshots: {', '.join(snapshot_names)}")
+            density_agent.generate_and_execute_density_field_batch(
+                simulation_output_dir=str(simulation_output_dir),
+                output_dir=str(visualization_output_dir),
+                snapshot_names=snapshot_names,
+                particle_type=1  # Dark matter particles
+            )
+            
+            missing = [
+                name for name in snapshot_names
+                if not (visualization_output_dir / f"density_field_{name}_type1.png").exists()
+            ]
+            if missing:
+                print(f"⚠️ Density field output not found for: {', '.join(missing)}")
+                return False
+            print(f"✅ Density field visualizations created for {len(snapshot_names)} snapshots")
+            return True
         
-        # Test with first available PART directory
-        snapshot_name = part_dirs[0].name
+        # Test with first available PART directory unless one was requested
+        snapshot_name = snapshot_names[0] if snapshot_names else part_dirs[0]
         print(f"🎯 Processing snapshot: {snapshot_name}")
         
         # Generate and execute density field visualization
@@ -116,8 +169,6 @@ def run_density_field_workflow(simulation_output_dir: Path, visualization_output
         expected_output = visualization_output_dir / f"density_field_{snapshot_name}_type1.png"
         if expected_output.exists():
             print(f"✅ Density field visualization created: {expected_output}")
-            # Clean up
-            density_agent.cleanup()
             return True
         else:
             # Check execution result for errors
@@ -133,8 +184,6 @@ def run_density_field_workflow(simulation_output_dir: Path, visualization_output
                     print(f"⚠️ Density field execution completed but output file not found")
                     print(f"📝 Execution details: {result}")
             
-            # Clean up
-            density_agent.cleanup()
             return False
             
     except Exception as e:
@@ -16,6 +16,7 @@ load_dotenv()
 sys.path.append(str(Path(__file__).parent.parent))
 
 from agents.density_field_agent import DensityFieldAgent
+from utils.file_utils import list_part_dirs
 
 
 def main():
@@ -48,14 +49,14 @@ def main():
         return
     
     # List available PART directories
-    part_dirs = list(simulation_output_dir.glob("PART_*"))
+    part_dirs = list_part_dirs(simulation_output_dir)
     if not part_dirs:
         print(f"❌ Error: No PART_* directories found in {simulation_output_dir}")
         return
     
     print(f"\n✅ Found {len(part_dirs)} PART directories:")
-    for part_dir in sorted(part_dirs):
-        print(f"  📄 {part_dir.name}")
+    for part_dir in part_dirs:
+        print(f"  📄 {part_dir}")
     
     try:
         # Create density field agent with RAG
@@ -65,7 +66,7 @@ def main():
         )
         
         # Test with first available PART directory
-        snapshot_name = part_dirs[0].name
+        snapshot_name = part_dirs[0]
         print(f"\n🎯 Processing snapshot: {snapshot_name}")
         
         # Generate and execute density field visualization
@@ -6,13 +6,26 @@ This workflow extracts MP-Gadget simulation parameters from scientific papers
 using the PhysicsPaperRetriever agent and saves them as separate JSON files.
 """
 
+import asyncio
 import os
+import hashlib
 import json
+import logging
+import mmap
 import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # orjson serializes faster and releases the GIL, but json still works
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -20,6 +33,70 @@ load_dotenv()
 sys.path.append(str(Path(__file__).parent.parent))
 
 from agents.parameter_retriever import PhysicsPaperRetriever
+from agents.vector_store_cache import hash_file
+from utils.semantic_cache import SemanticCache
+
+
+logger = logging.getLogger(__name__)
+
+EXACT_CACHE_SIZE = 256
+
+# Upper bound on papers extracted at once by run_batch (API rate limits)
+MAX_CONCURRENT_EXTRACTIONS = 4
+
+# In-process LRU of serialized results keyed by (paper path, paper mtime, prompt);
+# values are JSON strings so callers never share mutable dicts
+_exact_cache: "OrderedDict[Tuple[str, float, str], str]" = OrderedDict()
+_exact_cache_lock = threading.Lock()
+
+# Output directories already created by this process
+_ensured_dirs = set()
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    """Write data as indented UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        return
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
+
+
+@lru_cache(maxsize=1)
+def _get_write_executor() -> ThreadPoolExecutor:
+    """Two writer threads shared by every save, so batches do not spawn a pool per paper."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="parameter-writer")
+
+
+def _loads(data) -> Any:
+    """Parse JSON from str or bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _exact_cache_key(paper_path: str, custom_prompt: Optional[str]) -> Tuple[str, float, str]:
+    """Key identical extraction requests by the paper file's path and mtime and the prompt."""
+    return (os.path.abspath(paper_path), os.path.getmtime(paper_path), custom_prompt or "")
+
+
+def _exact_cache_get(key: Tuple[str, float, str]) -> Optional[Dict[str, Any]]:
+    """Return a copy of a memoized result, marking it most recently used."""
+    with _exact_cache_lock:
+        serialized = _exact_cache.get(key)
+        if serialized is None:
+            return None
+        _exact_cache.move_to_end(key)
+    return _loads(serialized)
+
+
+def _exact_cache_put(key: Tuple[str, float, str], result: Dict[str, Any]) -> None:
+    """Memoize a result, evicting the least recently used entry when full."""
+    serialized = json.dumps(result, ensure_ascii=False)
+    with _exact_cache_lock:
+        _exact_cache[key] = serialized
+        _exact_cache.move_to_end(key)
+        while len(_exact_cache) > EXACT_CACHE_SIZE:
+            _exact_cache.popitem(last=False)
 
 
 class ParameterExtractionWorkflow:
@@ -32,7 +109,8 @@ class ParameterExtractionWorkflow:
         api_key: Optional[str] = None,
         mp_gadget_docs_path: Optional[str] = None,
         max_iterations: int = 2,
-        custom_prompt: Optional[str] = None
+        custom_prompt: Optional[str] = None,
+        use_cache: bool = True
     ):
         """
         Initialize the parameter extraction workflow.
@@ -44,6 +122,8 @@ class ParameterExtractionWorkflow:
             mp_gadget_docs_path: Path to MP-Gadget documentation
             max_iterations: Maximum iterations for parameter refinement
             custom_prompt: Custom instruction for parameter extraction
+            use_cache: Reuse earlier extractions of the same paper with the same
+                or a semantically equivalent prompt
         """
         self.paper_path = paper_path
         self.output_dir = Path(output_dir)
@@ -59,16 +139,47 @@ class ParameterExtractionWorkflow:
         if not self.api_key:
             raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable or pass api_key parameter.")
         
-        # Create output directory
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Create output directory (once per process for a given path)
+        output_dir_key = os.path.abspath(self.output_dir)
+        if output_dir_key not in _ensured_dirs:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            _ensured_dirs.add(output_dir_key)
         
-        # Initialize the retriever
-        self.retriever = PhysicsPaperRetriever(
-            paper_path=paper_path,
-            api_key=self.api_key,
-            mp_gadget_docs_path=mp_gadget_docs_path,
-            max_iterations=max_iterations
-        )
+        # Set once cleanup() has run, so repeated calls are no-ops
+        self._cleaned = False
+        
+        # Cache of earlier extractions under output_dir/.cache/
+        self.cache = SemanticCache(self.output_dir / ".cache") if use_cache else None
+        
+        # Exact-match memo, persisted across restarts in output_dir/.exact_cache.json
+        self.exact_cache_path = self.output_dir / ".exact_cache.json"
+        if use_cache:
+            self._load_exact_cache()
+        
+        # Map the paper once; the retriever and the cache hash and upload it from
+        # the page cache instead of reopening the file
+        self._pdf_mm = None
+        try:
+            with open(paper_path, 'rb') as f:
+                self._pdf_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:  # ValueError: empty file
+            logger.warning("Could not memory-map %s: %s", paper_path, e)
+        
+        # The retriever is built on first use, so cache hits never create one
+        self._retriever = None
+    
+    @property
+    def retriever(self) -> PhysicsPaperRetriever:
+        """The paper retriever, created on first access."""
+        if self._retriever is None:
+            self._retriever = PhysicsPaperRetriever(
+                paper_path=self.paper_path,
+                api_key=self.api_key,
+                mp_gadget_docs_path=self.mp_gadget_docs_path,
+                max_iterations=self.max_iterations,
+                pdf_bytes=self._pdf_mm
+            )
+        return self._retriever
     
     def extract_parameters(self, custom_prompt: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -80,8 +191,8 @@ class ParameterExtractionWorkflow:
         Returns:
             Dictionary containing extracted parameters
         """
-        print("🔬 Starting parameter extraction...")
-        print(f"📄 Processing paper: {self.paper_path}")
+        logger.info("🔬 Starting parameter extraction...")
+        logger.info("📄 Processing paper: %s", self.paper_path)
         
         # Read paper content (for text-based extraction if needed)
         paper_content = f"PDF file: {self.paper_path}"
@@ -89,17 +200,44 @@ class ParameterExtractionWorkflow:
         # Use custom prompt from constructor or parameter
         prompt_to_use = custom_prompt or self.custom_prompt
         
+        # Identical requests skip both the embedding and the LLM work
+        exact_key = _exact_cache_key(self.paper_path, prompt_to_use)
+        if self.cache is not None:
+            cached = _exact_cache_get(exact_key)
+            if cached is not None:
+                logger.info("✅ Parameter extraction loaded from cache!")
+                return cached
+        
+        # Reuse an earlier extraction of this paper with an equivalent prompt
+        paper_hash = None
+        if self.cache is not None:
+            if self._pdf_mm is not None:
+                paper_hash = hashlib.sha256(self._pdf_mm).hexdigest()
+            else:
+                paper_hash = hash_file(self.paper_path)
+            cached = self.cache.lookup(paper_hash, prompt_to_use)
+            if cached is not None:
+                _exact_cache_put(exact_key, cached)
+                logger.info("✅ Parameter extraction loaded from cache!")
+                return cached
+        
         # Extract parameters
         parameters, reasoning = self.retriever.retrieve_parameters(
             paper_content=paper_content,
             custom_prompt=prompt_to_use
         )
         
-        print("✅ Parameter extraction completed!")
-        return {
+        result = {
             "parameters": parameters,
             "reasoning": reasoning
         }
+        # Only complete extractions are cached; failures are retried on the next run
+        if self.cache is not None and self.retriever.last_result_complete:
+            self.cache.store(paper_hash, prompt_to_use, result)
+            _exact_cache_put(exact_key, result)
+        
+        logger.info("✅ Parameter extraction completed!")
+        return result
     
     def save_parameters(self, extraction_result: Dict[str, Any], custom_prompt: Optional[str] = None) -> Dict[str, str]:
         """
@@ -125,9 +263,6 @@ class ParameterExtractionWorkflow:
             "parameters": parameters.get("genic", {})
         }
         
-        with open(genic_file, 'w', encoding='utf-8') as f:
-            json.dump(genic_data, f, indent=2, ensure_ascii=False)
-        
         # Save gadget parameters
         gadget_file = self.output_dir / f"{paper_name}_gadget.json"
         gadget_data = {
@@ -135,16 +270,16 @@ class ParameterExtractionWorkflow:
             "parameters": parameters.get("gadget", {})
         }
         
-        with open(gadget_file, 'w', encoding='utf-8') as f:
-            json.dump(gadget_data, f, indent=2, ensure_ascii=False)
+        # The two files are independent; serialize and write them concurrently
+        list(_get_write_executor().map(_write_json, [genic_file, gadget_file], [genic_data, gadget_data]))
         
         file_paths = {
             "genic": str(genic_file),
             "gadget": str(gadget_file)
         }
         
-        print(f"💾 Saved genic parameters: {genic_file}")
-        print(f"💾 Saved gadget parameters: {gadget_file}")
+        logger.info("💾 Saved genic parameters: %s", genic_file)
+        logger.info("💾 Saved gadget parameters: %s", gadget_file)
         
         return file_paths
     
@@ -165,20 +300,126 @@ class ParameterExtractionWorkflow:
             # Save to files
             file_paths = self.save_parameters(extraction_result, custom_prompt)
             
-            print("🎉 Parameter extraction workflow completed successfully!")
+            logger.info("🎉 Parameter extraction workflow completed successfully!")
             return file_paths
             
         except Exception as e:
-            print(f"❌ Error in parameter extraction workflow: {e}")
+            logger.error("❌ Error in parameter extraction workflow: %s", e)
             raise
-        finally:
-            # Clean up resources
-            self.retriever.cleanup()
+    
+    async def run_async(self, custom_prompt: Optional[str] = None) -> Dict[str, str]:
+        """
+        Run the workflow without blocking the event loop.
+        
+        The retriever's OpenAI calls and the file I/O are synchronous, so the
+        whole run is moved to a worker thread.
+        
+        Args:
+            custom_prompt: Optional custom instruction for parameter extraction
+            
+        Returns:
+            Dictionary with file paths of saved outputs
+        """
+        return await asyncio.to_thread(self.run, custom_prompt)
+    
+    def _load_exact_cache(self) -> None:
+        """Seed the in-process exact-match memo from output_dir/.exact_cache.json."""
+        try:
+            entries = _loads(self.exact_cache_path.read_bytes())
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Could not read %s: %s", self.exact_cache_path, e)
+            return
+        
+        with _exact_cache_lock:
+            for (paper_path, mtime, prompt), serialized in entries:
+                _exact_cache.setdefault((paper_path, mtime, prompt), serialized)
+    
+    def _save_exact_cache(self) -> None:
+        """
+        Persist this paper's exact-match memo entries so they survive restarts.
+        
+        Entries for other papers already in the file are kept; entries the process
+        holds for papers of other workflows are not written here.
+        """
+        paper_key = os.path.abspath(self.paper_path)
+        tmp_path = self.exact_cache_path.with_suffix(".json.tmp")
+        
+        # The lock also serializes the read-merge-write of workflows sharing output_dir
+        with _exact_cache_lock:
+            try:
+                entries = _loads(self.exact_cache_path.read_bytes())
+            except FileNotFoundError:
+                entries = []
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Could not read %s: %s", self.exact_cache_path, e)
+                entries = []
+            
+            entries = [entry for entry in entries if entry[0][0] != paper_key]
+            entries.extend([list(key), serialized] for key, serialized in _exact_cache.items() if key[0] == paper_key)
+            try:
+                tmp_path.write_text(json.dumps(entries, ensure_ascii=False), encoding='utf-8')
+                tmp_path.replace(self.exact_cache_path)
+            except OSError as e:
+                logger.warning("Could not write %s: %s", self.exact_cache_path, e)
     
     def cleanup(self):
-        """Clean up workflow resources."""
-        if hasattr(self, 'retriever'):
-            self.retriever.cleanup()
+        """Clean up workflow resources. Safe to call more than once."""
+        if getattr(self, '_cleaned', True):
+            return
+        self._cleaned = True
+        
+        if getattr(self, 'cache', None) is not None:
+            self._save_exact_cache()
+        retriever = getattr(self, '_retriever', None)
+        if retriever is not None:
+            retriever.cleanup()
+        if getattr(self, '_pdf_mm', None) is not None:
+            if retriever is not None:
+                retriever.pdf_bytes = None
+            self._pdf_mm.close()
+            self._pdf_mm = None
+
+
+async def run_batch(
+    paper_paths: List[str],
+    output_dir: str = "output",
+    custom_prompt: Optional[str] = None,
+    **kwargs
+) -> List[Dict[str, str]]:
+    """
+    Extract parameters from several papers concurrently.
+    
+    Each paper gets its own workflow, built and run in a worker thread; at most
+    MAX_CONCURRENT_EXTRACTIONS papers are in flight at once.
+    
+    Args:
+        paper_paths: Paths to the PDF papers
+        output_dir: Directory to save output files
+        custom_prompt: Custom instruction for parameter extraction
+        **kwargs: Further ParameterExtractionWorkflow arguments
+        
+    Returns:
+        Saved file paths for each paper, in the same order as paper_paths
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_EXTRACTIONS)
+    
+    async def run_one(paper_path: str) -> Dict[str, str]:
+        async with semaphore:
+            workflow = await asyncio.to_thread(
+                ParameterExtractionWorkflow,
+                paper_path=paper_path,
+                output_dir=output_dir,
+                custom_prompt=custom_prompt,
+                **kwargs
+            )
+            try:
+                return await workflow.run_async()
+            finally:
+                await asyncio.to_thread(workflow.cleanup)
+    
+    return await asyncio.gather(*[run_one(paper_path) for paper_path in paper_paths])
 
 
 def main():
@@ -194,6 +435,8 @@ def main():
     
     args = parser.parse_args()
     
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    
     # Create and run workflow
     workflow = ParameterExtractionWorkflow(
         paper_path=args.paper_path,
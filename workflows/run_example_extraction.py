@@ -3,6 +3,7 @@
 Example script for running parameter extraction on the example paper.
 """
 
+import logging
 import os
 import sys
 from pathlib import Path
@@ -20,6 +21,9 @@ from workflows.parameter_extraction import ParameterExtractionWorkflow
 def main():
     """Run parameter extraction on the example paper."""
     
+    # Show the workflow's progress messages
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    
     # Get the project root directory
     project_root = Path(__file__).parent.parent
     
@@ -29,10 +33,12 @@ def main():
     # Output directory inside example folder
     output_dir = project_root / "example" / "parameter_extraction_output"
     
-    print("🚀 Running Parameter Extraction Workflow")
-    print(f"📄 Paper: {paper_path}")
-    print(f"📁 Output directory: {output_dir}")
-    print("-" * 50)
+    sys.stdout.write("\n".join([
+        "🚀 Running Parameter Extraction Workflow",
+        f"📄 Paper: {paper_path}",
+        f"📁 Output directory: {output_dir}",
+        "-" * 50
+    ]) + "\n")
     
     # Check if paper exists
     if not paper_path.exists():
@@ -41,15 +47,20 @@ def main():
     
     # Check for API key
     if not os.environ.get("OPENAI_API_KEY"):
-        print("❌ Error: OPENAI_API_KEY environment variable not set")
-        print("Please set your OpenAI API key:")
-        print("export OPENAI_API_KEY='your-api-key-here'")
+        sys.stdout.write("\n".join([
+            "❌ Error: OPENAI_API_KEY environment variable not set",
+            "Please set your OpenAI API key:",
+            "export OPENAI_API_KEY='your-api-key-here'"
+        ]) + "\n")
         return
     
+    workflow = None
     try:
         # Get custom prompt from user input
-        print("\n🤖 Custom Prompt (optional):")
-        print("Enter a custom instruction for parameter extraction, or press Enter for default:")
+        sys.stdout.write(
+            "\n🤖 Custom Prompt (optional):\n"
+            "Enter a custom instruction for parameter extraction, or press Enter for default:\n"
+        )
         custom_prompt = input("Prompt: ").strip()
         
         # Use None if user didn't provide a prompt
@@ -67,16 +78,16 @@ def main():
         # Run extraction (custom prompt is already set in constructor)
         file_paths = workflow.run()
         
-        print("\n🎉 Extraction completed successfully!")
-        print("\n📁 Generated files:")
-        for file_type, file_path in file_paths.items():
-            print(f"  📄 {file_type.capitalize()}: {file_path}")
-            
-        print(f"\n✨ You can find the extracted parameters in: {output_dir}")
+        lines = ["\n🎉 Extraction completed successfully!", "\n📁 Generated files:"]
+        lines.extend(f"  📄 {file_type.capitalize()}: {file_path}" for file_type, file_path in file_paths.items())
+        lines.append(f"\n✨ You can find the extracted parameters in: {output_dir}")
+        sys.stdout.write("\n".join(lines) + "\n")
         
     except Exception as e:
-        print(f"\n💥 Error during extraction: {e}")
-        print("Please check your API key and try again.")
+        sys.stdout.write(f"\n💥 Error during extraction: {e}\nPlease check your API key and try again.\n")
+    finally:
+        if workflow is not None:
+            workflow.cleanup()
 
 
 if __name__ == "__main__":
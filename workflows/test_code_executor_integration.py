@@ -4,6 +4,9 @@ Test script for the CodeExecutor integration with VisualizationAgent and Density
 """
 
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import util
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -16,6 +19,47 @@ sys.path.append(str(Path(__file__).parent.parent))
 from agents.visualization_agent import VisualizationAgent
 from agents.density_field_agent import DensityFieldAgent
 from agents.code_executor import SharedCodeExecutor
+from utils.file_utils import list_part_dirs
+
+
+@lru_cache(maxsize=1)
+def _get_viz() -> VisualizationAgent:
+    """Create the visualization agent once per worker process and share it across tests."""
+    return VisualizationAgent()
+
+
+@lru_cache(maxsize=4)
+def _get_density(demo_path: str) -> DensityFieldAgent:
+    """Create the density field agent once per worker and demo file, so its RAG store is embedded only once."""
+    _density_paths.add(demo_path)
+    return DensityFieldAgent(gaepsi2_demo_path=demo_path)
+
+
+# Demo paths with a cached density field agent, for the worker teardown
+_density_paths = set()
+
+
+def _reset_agents() -> None:
+    """Release the worker's cached agents, cleaning up the density field agents' vector stores."""
+    for demo_path in _density_paths:
+        try:
+            _get_density(demo_path).cleanup()
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to clean up density field agent for {demo_path}: {e}")
+    _density_paths.clear()
+    _get_density.cache_clear()
+    _get_viz.cache_clear()
+
+
+def _init_worker() -> None:
+    """
+    Set up a test worker process.
+    
+    A worker may run several tests, which then share its agents; they are
+    released when the worker exits (atexit does not run in pool workers, so
+    a multiprocessing finalizer is used).
+    """
+    util.Finalize(None, _reset_agents, exitpriority=10)
 
 
 def test_visualization_agent_with_executor():
@@ -37,8 +81,8 @@ def test_visualization_agent_with_executor():
         return False
     
     try:
-        # Create visualization agent
-        viz_agent = VisualizationAgent()
+        # Get the worker's shared visualization agent
+        viz_agent = _get_viz()
         
         # Test automatic code generation and execution
         print("🚀 Testing automatic power spectrum plotting...")
@@ -86,20 +130,18 @@ def test_density_field_agent_with_executor():
         return False
     
     # List available PART directories
-    part_dirs = list(simulation_output_dir.glob("PART_*"))
+    part_dirs = list_part_dirs(simulation_output_dir)
     if not part_dirs:
         print(f"❌ Error: No PART_* directories found in {simulation_output_dir}")
         return False
     
     try:
         # Create density field agent with RAG
-        print(f"🤖 Creating DensityFieldAgent with RAG...")
-        density_agent = DensityFieldAgent(
-            gaepsi2_demo_path=str(demo_file)
-        )
+        print(f"🤖 Getting DensityFieldAgent with RAG...")
+        density_agent = _get_density(str(demo_file))
         
         # Test automatic code generation and execution
-        snapshot_name = part_dirs[0].name
+        snapshot_name = part_dirs[0]
         print(f"🎯 Testing automatic density field generation for: {snapshot_name}")
         
         result = density_agent.generate_and_execute_density_field(
@@ -112,9 +154,6 @@ def test_density_field_agent_with_executor():
         print(f"✅ DensityFieldAgent test completed")
         print(f"📊 Result: {result}")
         
-        # Clean up
-        density_agent.cleanup()
-        
         return True
         
     except Exception as e:
@@ -155,19 +194,37 @@ def test_shared_executor():
         return False
 
 
+def run_one(test) -> bool:
+    """
+    Run one integration test in a worker process.
+    
+    SharedCodeExecutor is a per-process singleton, so each test gets a fresh
+    executor and releases it when done. The agents stay cached for the next
+    test the worker runs and are released by _init_worker's finalizer.
+    """
+    try:
+        return test()
+    finally:
+        try:
+            SharedCodeExecutor.reset()
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to clean up after {test.__name__}: {e}")
+
+
 def main():
     """Run all integration tests."""
     print("🚀 Testing CodeExecutor Integration with Agents")
     print("=" * 60)
     
-    # Test SharedCodeExecutor
-    shared_test = test_shared_executor()
-    
-    # Test VisualizationAgent
-    viz_test = test_visualization_agent_with_executor()
-    
-    # Test DensityFieldAgent
-    density_test = test_density_field_agent_with_executor()
+    # The tests are independent, so run them in parallel processes: wall time is
+    # the slowest test rather than the sum (their output may interleave)
+    tests = [
+        test_shared_executor,
+        test_visualization_agent_with_executor,
+        test_density_field_agent_with_executor
+    ]
+    with ProcessPoolExecutor(max_workers=len(tests), initializer=_init_worker) as executor:
+        shared_test, viz_test, density_test = executor.map(run_one, tests)
     
     # Summary
     print("\n" + "=" * 60)
@@ -180,13 +237,6 @@ def main():
         print("\n🎉 All tests passed! CodeExecutor integration is working correctly.")
     else:
         print("\n⚠️ Some tests failed. Check the error messages above.")
-    
-    # Clean up shared executor
-    try:
-        SharedCodeExecutor.reset()
-        print("\n🧹 Cleaned up shared resources")
-    except Exception as e:
-        print(f"\n⚠️ Warning: Failed to clean up: {e}")
 
 
 if __name__ == "__main__":
@@ -3,8 +3,10 @@
 Test script for the updated VisualizationAgent that plots power spectra.
 """
 
+import os
 import sys
 from pathlib import Path
+import numpy as np
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,7 +15,15 @@ load_dotenv()
 # Add the parent directory to the path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from agents.visualization_agent import VisualizationAgent
+from agents.visualization_agent import VisualizationAgent, scale_factor_to_redshift
+
+
+def _parse_scale_factor(filename: str) -> float:
+    """Scale factor encoded in a powerspectrum-<a>.txt name, or NaN if it does not parse."""
+    try:
+        return float(filename.replace("powerspectrum-", "").replace(".txt", ""))
+    except ValueError:
+        return np.nan
 
 
 def main():
@@ -35,26 +45,34 @@ def main():
         print(f"❌ Error: Directory not found: {simulation_output_dir}")
         return
     
-    # List power spectrum files
-    import glob
-    pattern = str(simulation_output_dir / "powerspectrum-*.txt")
-    files = glob.glob(pattern)
+    # List power spectrum file names, sorted
+    with os.scandir(simulation_output_dir) as entries:
+        filenames = sorted(
+            entry.name for entry in entries
+            if entry.name.startswith("powerspectrum-") and entry.name.endswith(".txt")
+        )
     
-    if not files:
+    if not filenames:
         print(f"❌ No power spectrum files found matching pattern: powerspectrum-*.txt")
         return
     
-    print(f"✅ Found {len(files)} power spectrum files:")
-    for file in sorted(files):
-        filename = Path(file).name
-        # Extract scale factor
-        scale_factor_str = filename.replace("powerspectrum-", "").replace(".txt", "")
-        try:
-            scale_factor = float(scale_factor_str)
-            redshift = 1.0 / scale_factor - 1.0
-            print(f"  📄 {filename} -> z = {redshift:.3f}")
-        except ValueError:
-            print(f"  ⚠️  {filename} -> Invalid scale factor")
+    print(f"✅ Found {len(filenames)} power spectrum files:")
+    
+    # Extract scale factors (NaN marks names that do not parse) and convert
+    # them to redshifts in one pass
+    scale_factors = np.fromiter(
+        (_parse_scale_factor(filename) for filename in filenames),
+        dtype=np.float64,
+        count=len(filenames)
+    )
+    redshifts = scale_factor_to_redshift(scale_factors)
+    
+    lines = [
+        f"  📄 {filename} -> z = {redshift:.3f}" if not np.isnan(redshift)
+        else f"  ⚠️  {filename} -> Invalid scale factor"
+        for filename, redshift in zip(filenames, redshifts)
+    ]
+    sys.stdout.write("\n".join(lines) + "\n")
     
     # Create visualization agent
     viz_agent = VisualizationAgent()
@@ -15,6 +15,7 @@ load_dotenv()
 sys.path.append(str(Path(__file__).parent.parent))
 
 from agents.visualization_agent import VisualizationAgent
+from agents.vector_store_cache import hash_files
 
 
 def main():
@@ -25,10 +26,12 @@ def main():
     simulation_output_dir = project_root / "example" / "simulation_output" / "output"
     visualization_output_dir = project_root / "example" / "visualization_output"
     
-    print("🎨 Starting Visualization Workflow")
-    print("=" * 50)
-    print(f"📁 Simulation output: {simulation_output_dir}")
-    print(f"📁 Visualization output: {visualization_output_dir}")
+    sys.stdout.write("\n".join([
+        "🎨 Starting Visualization Workflow",
+        "=" * 50,
+        f"📁 Simulation output: {simulation_output_dir}",
+        f"📁 Visualization output: {visualization_output_dir}"
+    ]) + "\n")
     
     # Create output directory
     visualization_output_dir.mkdir(exist_ok=True)
@@ -38,6 +41,21 @@ def main():
         print(f"❌ Error: Simulation output directory not found: {simulation_output_dir}")
         return
     
+    # Skip the agent entirely when the existing plot was made from identical inputs
+    output_file = str(visualization_output_dir / "power_spectrum.png")
+    signature_file = Path(output_file + ".sig")
+    # Snapshots.txt decides which spectra are plotted, so it is an input too
+    input_files = sorted(simulation_output_dir.glob("powerspectrum-*.txt"))
+    snapshots_file = simulation_output_dir / "Snapshots.txt"
+    if snapshots_file.exists():
+        input_files.append(snapshots_file)
+    inputs_signature = hash_files(input_files)
+    if Path(output_file).exists() and signature_file.exists():
+        if signature_file.read_text().strip() == inputs_signature:
+            print(f"\n✅ Power spectrum plot is up to date (cached): {output_file}")
+            return
+    signature_file.unlink(missing_ok=True)
+    
     try:
         # Create visualization agent
         print("\n🤖 Creating VisualizationAgent...")
@@ -45,28 +63,31 @@ def main():
         
         # Generate and execute power spectrum plot
         print("\n🚀 Generating power spectrum plot...")
-        output_file = str(visualization_output_dir / "power_spectrum.png")
         
         result = viz_agent.generate_and_execute_plot(
             output_dir=str(simulation_output_dir),
             output_filename=output_file
         )
         
-        print(f"\n✅ Visualization workflow completed!")
-        print(f"📊 Power spectrum plot saved to: {output_file}")
+        lines = [
+            "\n✅ Visualization workflow completed!",
+            f"📊 Power spectrum plot saved to: {output_file}"
+        ]
         
         # Check if the output file was created
         if Path(output_file).exists():
-            print(f"🎯 Execution result: Success - Plot file created")
+            lines.append("🎯 Execution result: Success - Plot file created")
+            signature_file.write_text(inputs_signature)
         else:
-            print(f"🎯 Execution result: Warning - Plot file not found")
+            lines.append("🎯 Execution result: Warning - Plot file not found")
         
-        print(f"📝 Chat completed with {len(result.chat_history)} messages")
+        lines.append(f"📝 Chat completed with {len(result.chat_history)} messages")
+        sys.stdout.write("\n".join(lines) + "\n")
         
     except Exception as e:
         print(f"\n💥 Error during visualization workflow: {e}")
         import traceback
-        traceback.print_exc()
+        sys.stderr.write(traceback.format_exc())
 
 
 if __name__ == "__main__":